@@ -0,0 +1,34 @@
+"""Load many PDFs into one index (the shared corpus by default) in large insert batches
+
+    python bulk_load.py docs/*.pdf --tags hr,policy [--index corpus] [--batch-size 4096]
+
+Uses the backend selected by VECTOR_BACKEND. Files already in the index are skipped, so an
+interrupted load can be rerun with the same arguments. Run it while the server is stopped, or
+restart the server afterwards so it reloads the index.
+"""
+import classes.env  # Loads .env before any module reads its settings
+import argparse
+import time
+
+from classes.RAG_Pipeline import RAG_pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="+", help="PDF files to load")
+    parser.add_argument("--tags", default="", help="comma-separated tags for every file")
+    parser.add_argument("--index", default=None, help="index id (defaults to CORPUS_ID)")
+    parser.add_argument("--batch-size", type=int, default=None, help="chunks per insert (defaults to BULK_LOAD_BATCH_SIZE)")
+    args = parser.parse_args()
+
+    tags = [tag.strip() for tag in args.tags.split(",") if tag.strip()] or None
+    started = time.perf_counter()
+    pipeline = RAG_pipeline()
+    result = pipeline.bulk_load(args.files, tags=tags, index_id=args.index, batch_size=args.batch_size)
+    print(f"Loaded {result['documents']} file(s), {result['added_chunks']} chunks into "
+          f"{args.index or pipeline.corpus_id} ({pipeline.vector_backend.name}); skipped {result['skipped']} "
+          f"already indexed, {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,316 @@
-from classes.proccessing import PDFProcessor 
-from classes.addVector import VectorEmbedder 
-from classes.RAG_chains import RAGChainWithHistory 
-
-class RAG_pipeline: 
-    
-    def __init__(self): 
-        self.pdf_processor = PDFProcessor() 
-        self.vector_embedder = VectorEmbedder()
+import os
+import time
+import uuid
+from classes.proccessing import PDFProcessor
+from classes.addVector import VectorEmbedder
+from classes.RAG_chains import RAGChainWithHistory
+from classes.indexStore import IndexStore
+from classes.documentRegistry import DocumentSession
+from classes.addNewVector import VectorUpdater, tag_chunks
+from classes.answerCache import SemanticAnswerCache
+from classes.metrics import metrics
+from classes.dedup import ChunkDeduplicator
+from classes.vectorBackends import create_vector_backend
+
+class RAG_pipeline:
+
+    def __init__(self):
+        # Models and the index store are shared; per-document state lives in DocumentSession
+        self.pdf_processor = PDFProcessor()
+        self.index_store = IndexStore()
+        self.vector_backend = create_vector_backend(index_store=self.index_store)
+        self.vector_embedder = VectorEmbedder(backend=self.vector_backend)
         self.rag_chain = RAGChainWithHistory()
+        self.vector_updater = VectorUpdater()
+        self.answer_cache = SemanticAnswerCache(self.vector_embedder.embeddings)
+        self.dedup_chunks = os.getenv("DEDUP_CHUNKS", "1") == "1"
+        # Index id of the shared multi-document corpus
+        self.corpus_id = os.getenv("CORPUS_ID", "corpus")
+        self.doc_id = None
         self.vector_store = None
         self.retriever = None
         self.conversational_rag_chain = None
         self.is_initialized = False
 
-    def start_RAG(self, file_path): 
+    def warm_up(self) -> dict:
+        """Load the embedding model and LLM client ahead of the first request; returns seconds per step"""
+        timings = {}
+        start = time.perf_counter()
+        self.vector_embedder.base_embeddings.warm_up()
+        timings["embedding_model"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        self.rag_chain.question_rewriter  # Creates the LLM client
+        self.rag_chain.create_question_answer_chain()  # Imports the chain constructors
+        timings["llm_client"] = round(time.perf_counter() - start, 3)
+        return timings
+
+    def open_document(self, file_path, on_progress=None, parse_executor=None, on_session=None):
+        """Build (or load from disk) the index for a PDF and return a DocumentSession for it
+
+        Pages, chunks and embedding batches are streamed, so only one batch is in memory at a time.
+        on_progress(stage, **counters) is called as ingestion advances; parse_executor, if given,
+        shards PDF parsing and chunking across worker processes; on_session(session), if given,
+        receives the session as soon as the first batch is searchable.
+        """
+        on_progress = on_progress or (lambda stage=None, **counters: None)
+
+        # Documents are keyed by content hash, so re-uploads reuse the stored index
+        doc_id = self.index_store.hash_file(file_path)
+
+        if self.vector_backend.exists(doc_id):
+            session = self.load_document(doc_id)
+            if set(session.vector_store.documents()) == {doc_id}:
+                on_progress("loading")
+                return session
+            # Changed in place before edited indexes got their own ids; it no longer holds just this PDF
+            print(f"Stored index for document {doc_id[:12]} no longer matches the PDF, rebuilding")
+
+        # Step 1: Stream text chunks out of the PDF
+        print("Processing PDF...")
+        chunk_stream = tag_chunks(self._chunk_stream(file_path, on_progress, parse_executor), doc_id)
+        # Whatever is stored under doc_id is stale or was never completed
+        return self._build_index(doc_id, chunk_stream, on_progress, on_session, rebuild=True)
+
+    def create_corpus(self, file_path, tags=None, on_progress=None, parse_executor=None):
+        """Start the shared corpus index with its first PDF; later PDFs are added with add_to_document
+
+        Returns the corpus session and the same summary add_to_document gives.
+        """
+        on_progress = on_progress or (lambda stage=None, **counters: None)
+        source_id = self.index_store.hash_file(file_path)
+        chunk_stream = tag_chunks(self._chunk_stream(file_path, on_progress, parse_executor), source_id, tags)
+        # Only a collection left by an interrupted first upload is replaced, never a complete corpus
+        session = self._build_index(self.corpus_id, chunk_stream, on_progress,
+                                    rebuild=not self.vector_backend.exists(self.corpus_id))
+        return session, {"source_id": source_id, "added_chunks": session.vector_store.count()}
+
+    def _build_index(self, doc_id, chunk_stream, on_progress, on_session=None, rebuild=False):
+        """Embed a tagged chunk stream into a new index saved under doc_id and return its session
+
+        rebuild=True replaces an index already stored under doc_id.
+        """
+        # Step 2: Embed chunks in batches, appending each batch to the vector store
+        print("Creating embeddings and vector store...")
+        session = None
+        created = None
+
+        def on_batch(vector_store, chunks_embedded):
+            nonlocal session, created
+            created = vector_store
+            on_progress("embedding", chunks_embedded=chunks_embedded)
+            if session is None and on_session is not None:
+                # The first part of the document is queryable while the rest is embedded
+                session = self._create_session(doc_id, vector_store, self.vector_embedder.build_retriever(vector_store))
+                on_session(session)
 
-            
         try:
-            # Step 1: Process the PDF and get text chunks 
-            print("Processing PDF...")
-            processed_chunks = self.pdf_processor.process_pdf(file_path) 
-            print(f"Created {len(processed_chunks)} chunks from PDF")
-
-            # Step 2: Initialize embeddings and vector store 
-            print("Creating embeddings and vector store...")
-            self.retriever, self.vector_store = self.vector_embedder.embed_chunks(processed_chunks)
+            retriever, vector_store = self.vector_embedder.embed_stream(chunk_stream, on_batch=on_batch,
+                                                                     index_id=doc_id, rebuild=rebuild)
+            total_chunks = vector_store.count()
+            print(f"Created {total_chunks} chunks from PDF")
             print("Vector store created successfully")
+            print(f"Embedding cache: {self.vector_embedder.embedding_cache.stats()}")
+
+            on_progress("indexing", total_chunks=total_chunks)
+            metrics.inc("rag_documents_ingested_total")
+            metrics.inc("rag_chunks_indexed_total", total_chunks)
+            report = self.vector_embedder.optimize_index(vector_store)
+            if report:
+                on_progress(index_type=report["index_type"], recall_at_k=report["recall@4"])
+            self.vector_backend.save(doc_id, vector_store)
+        except BaseException:
+            if created is not None:
+                self.vector_backend.discard(created)
+            raise
+        # Answers cached while only part of the document was searchable are stale now
+        self.answer_cache.invalidate(doc_id)
+        print(f"Saved index for document {doc_id[:12]}")
+
+        if session is not None:
+            session.refresh_memory()
+            return session
+        return self._create_session(doc_id, vector_store, retriever)
+
+    def _chunk_stream(self, file_path, on_progress, parse_executor=None):
+        on_progress("parsing")
+        report_pages = lambda done, total: on_progress(pages_parsed=done, total_pages=total)
+        if parse_executor is not None:
+            chunks = self.pdf_processor.iter_chunks_parallel(
+                file_path, executor=parse_executor, progress_callback=report_pages
+            )
+        else:
+            chunks = self.pdf_processor.iter_chunks(file_path, progress_callback=report_pages)
+        if not self.dedup_chunks:
+            return chunks
+        return self._deduplicated(chunks, on_progress)
+
+    def _deduplicated(self, chunks, on_progress):
+        """Drop repeated chunks before they are embedded, reporting how many were removed"""
+        deduplicator = ChunkDeduplicator()
+        yield from deduplicator.filter(chunks)
+        removed = deduplicator.removed_exact + deduplicator.removed_near
+        metrics.inc("rag_chunks_deduplicated_total", deduplicator.removed_exact, kind="exact")
+        metrics.inc("rag_chunks_deduplicated_total", deduplicator.removed_near, kind="near")
+        if removed:
+            print(f"Removed {removed} duplicate chunks ({deduplicator.removed_near} near-duplicates)")
+        on_progress(duplicate_chunks_removed=deduplicator.removed_exact,
+                    near_duplicate_chunks_removed=deduplicator.removed_near)
+
+    def _writable_session(self, session):
+        """Session whose index may be changed in place
+
+        An index stored under its PDF's content hash is what every re-upload of that PDF reuses, so it
+        is never edited: the first change is made to a copy saved under a new id, returned here.
+        """
+        if session.doc_id not in session.vector_store.documents():
+            return session
+        doc_id = uuid.uuid4().hex
+        print(f"Copying document {session.doc_id[:12]} to {doc_id[:12]} before changing it")
+        vector_store = self.vector_backend.copy(session.doc_id, doc_id, self.vector_embedder.embeddings)
+        return self._create_session(doc_id, vector_store, self.vector_embedder.build_retriever(vector_store))
+
+    def add_to_document(self, session, file_path, on_progress=None, parse_executor=None, tags=None,
+                        on_session=None):
+        """Add another PDF's chunks to an existing document index without rebuilding it
 
-            # Step 3: Create RAG chain with history 
-            print("Setting up RAG chain...")
-            self.conversational_rag_chain = self.rag_chain.create_conversational_rag_chain(self.retriever)
-            print("RAG chain initialized")
+        The result's doc_id is the index that was changed; it differs from session.doc_id when a
+        content-addressed index had to be copied first (see _writable_session). on_session(session),
+        if given, receives the changed session once it is saved, so a copy can be registered.
+        """
+        on_progress = on_progress or (lambda stage=None, **counters: None)
+        source_id = self.index_store.hash_file(file_path)
+        if self.vector_updater.chunk_ids(session.vector_store, source_id):
+            return {"doc_id": session.doc_id, "source_id": source_id, "added_chunks": 0}
+
+        session = self._writable_session(session)
+        chunk_stream = self._chunk_stream(file_path, on_progress, parse_executor)
+        on_progress("embedding")
+        added = self.vector_updater.add_document(
+            session.vector_store, chunk_stream, source_id,
+            progress_callback=lambda done: on_progress(chunks_embedded=done), tags=tags,
+        )
+        metrics.inc("rag_chunks_indexed_total", added)
+        self._save_session(session, on_progress, on_session)
+        return {"doc_id": session.doc_id, "source_id": source_id, "added_chunks": added}
+
+    def remove_from_document(self, session, source_id, on_session=None):
+        """Delete one source PDF's chunks from a document index (on_session as in add_to_document)"""
+        if not self.vector_updater.chunk_ids(session.vector_store, source_id):
+            return {"doc_id": session.doc_id, "source_id": source_id, "removed_chunks": 0}
+        session = self._writable_session(session)
+        removed = self.vector_updater.delete_document(session.vector_store, source_id)
+        self._save_session(session, on_session=on_session)
+        return {"doc_id": session.doc_id, "source_id": source_id, "removed_chunks": removed}
+
+    def replace_in_document(self, session, source_id, file_path, on_progress=None, parse_executor=None,
+                            on_session=None):
+        """Replace a source PDF with a revised version, re-embedding only the chunks that changed
+
+        on_session as in add_to_document.
+        """
+        on_progress = on_progress or (lambda stage=None, **counters: None)
+        new_source_id = self.index_store.hash_file(file_path)
+
+        chunks = list(self._chunk_stream(file_path, on_progress, parse_executor))
+        session = self._writable_session(session)
+        on_progress("embedding")
+        result = self.vector_updater.replace_document(session.vector_store, source_id, chunks, new_source_id)
+        self._save_session(session, on_progress, on_session)
+        return {"doc_id": session.doc_id, "source_id": new_source_id, **result}
+
+    def bulk_load(self, file_paths, tags=None, index_id=None, batch_size=None, parse_executor=None):
+        """Load many PDFs into one index (the corpus by default) in large insert batches
+
+        Chunks of all files flow through one stream, so batches span files; the index is optimized
+        and saved once at the end instead of after every file. Files already in the index are skipped.
+        Returns {"added_chunks", "documents", "skipped"}.
+        """
+        index_id = index_id or self.corpus_id
+        batch_size = batch_size or int(os.getenv("BULK_LOAD_BATCH_SIZE", 4096))
+        vector_store = None
+        if self.vector_backend.exists(index_id):
+            vector_store = self.vector_backend.load(index_id, self.vector_embedder.embeddings)
+            IndexStore.ensure_writable(vector_store)
+        known = set(vector_store.documents()) if vector_store is not None else set()
+
+        sources, skipped = [], 0
+        for file_path in file_paths:
+            source_id = self.index_store.hash_file(file_path)
+            if source_id in known:
+                skipped += 1
+                continue
+            known.add(source_id)
+            sources.append((file_path, source_id))
+
+        def chunk_stream():
+            for done, (file_path, source_id) in enumerate(sources, start=1):
+                yield from tag_chunks(self._chunk_stream(file_path, lambda *args, **kwargs: None, parse_executor),
+                                      source_id, tags)
+                print(f"Parsed {done}/{len(sources)}: {file_path}")
+
+        before = vector_store.count() if vector_store is not None else 0
+        if sources:
+            _, vector_store = self.vector_embedder.embed_stream(
+                chunk_stream(), batch_size=batch_size, index_id=index_id, vector_store=vector_store,
+                # A new store is only created when nothing complete is stored under index_id
+                rebuild=vector_store is None,
+            )
+            self.vector_embedder.optimize_index(vector_store)
+            self.vector_backend.save(index_id, vector_store)
+            self.answer_cache.invalidate(index_id)
+        added = vector_store.count() - before if vector_store is not None else 0
+        metrics.inc("rag_documents_ingested_total", len(sources))
+        metrics.inc("rag_chunks_indexed_total", added)
+        return {"added_chunks": added, "documents": len(sources), "skipped": skipped}
+
+    def _save_session(self, session, on_progress=None, on_session=None):
+        if on_progress:
+            on_progress("indexing")
+        # The corpus may have grown past the next index-type threshold
+        self.vector_embedder.optimize_index(session.vector_store)
+        self.vector_backend.save(session.doc_id, session.vector_store)
+        self.answer_cache.invalidate(session.doc_id)
+        session.refresh_memory()
+        if on_session is not None:
+            on_session(session)
+
+    def load_document(self, doc_id):
+        """Load a previously saved index from disk, skipping PDF parsing and embedding"""
+        if not self.vector_backend.exists(doc_id):
+            return None
+
+        print(f"Loading stored index for document {doc_id[:12]}...")
+        vector_store = self.vector_backend.load(doc_id, self.vector_embedder.embeddings)
+        retriever = self.vector_embedder.build_retriever(vector_store)
+        print("Vector store loaded from disk")
+
+        return self._create_session(doc_id, vector_store, retriever)
+
+    def _create_session(self, doc_id, vector_store, retriever):
+        # Step 3: Create RAG chain with history
+        print("Setting up RAG chain...")
+        conversational_rag_chain = self.rag_chain.create_conversational_rag_chain(retriever)
+        print("RAG chain initialized")
+        return DocumentSession(doc_id, vector_store, retriever, conversational_rag_chain,
+                               answer_cache=self.answer_cache,
+                               question_rewriter=self.rag_chain.question_rewriter)
+
+    def start_RAG(self, file_path):
+        """Process a PDF and make it the pipeline's current document"""
+        try:
+            session = self.open_document(file_path)
+
+            self.doc_id = session.doc_id
+            self.vector_store = session.vector_store
+            self.retriever = session.retriever
+            self.conversational_rag_chain = session.conversational_rag_chain
 
             # Mark as initialized
             self.is_initialized = True
 
             return "RAG is READY"
-            
+
         except Exception as e:
             print(f"Error in RAG pipeline: {str(e)}")
             return f"Sorry, I encountered an error: {str(e)}"
-    
-
-    
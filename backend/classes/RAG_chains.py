@@ -1,22 +1,10 @@
-from langchain.chains import create_history_aware_retriever
 from langchain_core.prompts import MessagesPlaceholder
+from langchain_core.runnables import RunnableLambda
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
-from pathlib import Path
-from dotenv import load_dotenv
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
-import os
-
-# Fix .env path resolution - look for .env in project root
-current_dir = Path(__file__).parent
-project_root = current_dir.parent.parent  # Go up to RAG project root
-env_path = project_root / '.env'
-load_dotenv(env_path)
+from classes.questionRewriter import QuestionRewriter
+from classes.llmClient import create_llm
+import threading
 
 
 
@@ -24,12 +12,32 @@ load_dotenv(env_path)
 
 class RAGChainWithHistory: 
     def __init__(self):
-        self.llm = ChatGroq(
-            groq_api_key=os.getenv("GROQ_API_KEY"), 
-            model_name="Gemma2-9b-It"
-        )
+        # The LLM client and rewriter are created on first use so startup doesn't import langchain_groq
+        # (LLM_PROVIDER=stub swaps in a local model for tests)
+        self._llm = None
+        self._question_rewriter = None
+        self._lock = threading.Lock()
         self.conversational_rag_chain = None
 
+    @property
+    def llm(self):
+        with self._lock:
+            if self._llm is None:
+                self._llm = create_llm(model_name="Gemma2-9b-It")
+            return self._llm
+
+    @property
+    def question_rewriter(self):
+        # Shared across documents: reformulation only depends on the history and question
+        if self._question_rewriter is None:
+            llm = self.llm
+            with self._lock:
+                if self._question_rewriter is None:
+                    # Tagged so LLM metrics can tell the rewrite call from answer generation
+                    self._question_rewriter = QuestionRewriter(llm.with_config(tags=["rewrite"]),
+                                                               self.create_contextualize_q_prompt())
+        return self._question_rewriter
+
     def create_contextualize_q_prompt(self):
         contextualize_q_system_prompt = """Given a chat history and the latest user question 
         which might reference context in the chat history, formulate a standalone question 
@@ -44,15 +52,19 @@ class RAGChainWithHistory:
         return contextualize_q_prompt
     
     def create_history_aware_retriever(self, retriever):
-        contextualize_q_prompt = self.create_contextualize_q_prompt()
-        history_aware_retriever = create_history_aware_retriever(
-            llm=self.llm,
-            retriever=retriever,
-            prompt=contextualize_q_prompt,
+        """Retrieve with a standalone question; the rewrite LLM call is skipped when not needed"""
+        contextualize_q = RunnableLambda(
+            self.question_rewriter.standalone_question,
+            afunc=self.question_rewriter.astandalone_question,
+        )
+        history_aware_retriever = (contextualize_q | retriever).with_config(
+            run_name="chat_retriever_chain"
         )
         return history_aware_retriever
     
     def create_question_answer_chain(self): 
+        from langchain.chains.combine_documents import create_stuff_documents_chain
+
         qa_system_prompt = """You are an assistant for question-answering tasks. 
         Use the following pieces of retrieved context to answer the question. 
         If you don't know the answer, just say that you don't know. 
@@ -66,7 +78,7 @@ class RAGChainWithHistory:
             ("human", "{input}"),
         ])
         qa_chain = create_stuff_documents_chain(
-            llm=self.llm,
+            llm=self.llm.with_config(tags=["generation"]),
             prompt=qa_prompt
         ) 
 
@@ -74,6 +86,8 @@ class RAGChainWithHistory:
     
     def create_conversational_rag_chain(self, retriever):
         """Create the complete conversational RAG chain"""
+        from langchain.chains import create_retrieval_chain
+
         history_aware_retriever = self.create_history_aware_retriever(retriever)
         qa_chain = self.create_question_answer_chain()
         
@@ -0,0 +1,119 @@
+import hashlib
+from itertools import islice
+
+from classes.indexStore import IndexStore
+
+
+def chunk_hash(text: str) -> str:
+    """Short content hash used to tell unchanged chunks apart from edited ones"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def page_hashes(chunks) -> dict:
+    """Page number -> hash of its text, from the "page_hashes" DocumentChunker gives each chunk"""
+    hashes = {}
+    for chunk in chunks:
+        for entry in (chunk.metadata.get("page_hashes") or "").split():
+            page, _, digest = entry.partition(":")
+            hashes[int(page)] = digest
+    return hashes
+
+
+def tag_chunks(chunks, doc_id, tags=None):
+    """Stamp each chunk with the id of the document it came from, its content hash and any tags"""
+    for chunk in chunks:
+        chunk.metadata["doc_id"] = doc_id
+        chunk.metadata["chunk_hash"] = chunk_hash(chunk.page_content)
+        if tags:
+            chunk.metadata["tags"] = list(tags)
+        yield chunk
+
+
+class VectorUpdater:
+    """Add, delete and replace documents inside an existing vector store without rebuilding it"""
+
+    def __init__(self, batch_size=64):
+        self.batch_size = batch_size
+
+    def chunk_ids(self, vector_store, doc_id):
+        """Ids of every chunk that belongs to doc_id"""
+        return vector_store.chunk_ids(doc_id)
+
+    def documents(self, vector_store) -> dict:
+        """Chunk count per document id in the store"""
+        return vector_store.documents()
+
+    def add_document(self, vector_store, chunks, doc_id, progress_callback=None, tags=None) -> int:
+        """Embed a new document's chunks in batches and append them to the store"""
+        IndexStore.ensure_writable(vector_store)
+        chunks = tag_chunks(chunks, doc_id, tags)
+        added = 0
+        while True:
+            batch = list(islice(chunks, self.batch_size))
+            if not batch:
+                break
+            vector_store.add_documents(batch)
+            added += len(batch)
+            if progress_callback:
+                progress_callback(added)
+        return added
+
+    def delete_document(self, vector_store, doc_id) -> int:
+        """Remove every chunk of doc_id from the store"""
+        ids = self.chunk_ids(vector_store, doc_id)
+        if ids:
+            IndexStore.ensure_writable(vector_store)
+            vector_store.delete(ids)
+        return len(ids)
+
+    def replace_document(self, vector_store, old_doc_id, chunks, new_doc_id) -> dict:
+        """Swap in a revised version of a document, re-embedding only chunks whose text changed"""
+        IndexStore.ensure_writable(vector_store)
+
+        # Existing chunks of the old version, grouped by content hash
+        existing = {}
+        old_ids = self.chunk_ids(vector_store, old_doc_id)
+        old_docs = vector_store.get_documents(old_ids)
+        for docstore_id, doc in zip(old_ids, old_docs):
+            existing.setdefault(doc.metadata.get("chunk_hash"), []).append(docstore_id)
+
+        kept_ids, kept_metadata = [], []
+        new_chunks = []
+        chunks = list(tag_chunks(chunks, new_doc_id, vector_store.document_tags(old_doc_id)))
+        for chunk in chunks:
+            matches = existing.get(chunk.metadata["chunk_hash"])
+            if matches:
+                # Unchanged text: keep the stored vector, only refresh its metadata
+                kept_ids.append(matches.pop())
+                kept_metadata.append(chunk.metadata)
+            else:
+                new_chunks.append(chunk)
+
+        vector_store.update_metadata(kept_ids, kept_metadata)
+
+        stale_ids = [docstore_id for ids in existing.values() for docstore_id in ids]
+        old_pages, new_pages = page_hashes(old_docs), page_hashes(chunks)
+        if old_pages and new_pages:
+            # Chunks span page breaks, so one edit makes every page of the chunks around it stale;
+            # only report pages whose own text is new (or, in the old numbering, gone)
+            old_digests, new_digests = set(old_pages.values()), set(new_pages.values())
+            changed_pages = {page for page, digest in new_pages.items() if digest not in old_digests}
+            removed_pages = {page for page, digest in old_pages.items() if digest not in new_digests}
+        else:
+            # Indexed before pages were fingerprinted: report the pages of every re-embedded chunk
+            changed_pages = {chunk.metadata.get("page") for chunk in new_chunks}
+            changed_pages.update(doc.metadata.get("page") for doc in vector_store.get_documents(stale_ids))
+            removed_pages = set()
+        if stale_ids:
+            vector_store.delete(stale_ids)
+
+        for start in range(0, len(new_chunks), self.batch_size):
+            vector_store.add_documents(new_chunks[start:start + self.batch_size])
+
+        return {
+            "kept_chunks": len(kept_ids),
+            "added_chunks": len(new_chunks),
+            "removed_chunks": len(stale_ids),
+            "changed_pages": sorted(page for page in changed_pages if page is not None),
+            "removed_pages": sorted(removed_pages),
+        }
@@ -1,42 +1,160 @@
 import os
-from pathlib import Path
-from dotenv import load_dotenv
-
-# Fix .env path resolution - look for .env in project root
-current_dir = Path(__file__).parent
-project_root = current_dir.parent.parent  # Go up to RAG project root
-env_path = project_root / '.env'
-load_dotenv(env_path)
-
-os.environ["HF_TOKEN"]=os.getenv("HF_TOKEN")
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+from itertools import islice
+from classes.embeddingEngine import EmbeddingEngine, parity_check
 from classes.proccessing import PDFProcessor
+from classes.embeddingCache import EmbeddingCache, CachedEmbeddings
+from classes.hybridRetriever import HybridRetriever
+from classes.metrics import metrics
+from classes.annIndex import (FALLBACK_INDEX_TYPES, LOSSY_INDEX_TYPES, choose_index_type, convert_index,
+                              index_type_of, reconstruct_all)
+import faiss
+import numpy as np
+
 
 class VectorEmbedder: 
-    def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2", 
-            model_kwargs={"device": "cpu"}
-        )
+    def __init__(self, model_name="all-MiniLM-L6-v2", index_type=None, backend=None):
+        self.model_name = model_name
+        # flat, fp16, hnsw, hnsw_fp16, ivf, ivfpq, or auto (chosen by corpus size)
+        self.index_type = index_type or os.getenv("FAISS_INDEX_TYPE", "auto")
+        if backend is None:
+            from classes.vectorBackends import create_vector_backend
+            backend = create_vector_backend()
+        # Where vectors live: in-memory FAISS or on-disk Chroma (VECTOR_BACKEND)
+        self.backend = backend
+        self.base_embeddings = EmbeddingEngine(model_name)
+        # Re-uploaded or revised PDFs mostly contain chunks we have already embedded
+        self.embedding_cache = EmbeddingCache()
+        self.embeddings = CachedEmbeddings(self.base_embeddings, self.embedding_cache,
+                                           self.base_embeddings.cache_name)
+        self.parity_check_pending = os.getenv("EMBEDDING_PARITY_CHECK", "0") == "1"
 
-    def embed_chunks(self, processed_chunks):
-        """Create FAISS vector store from processed document chunks"""
-        vector_store = FAISS.from_documents(
-            documents=processed_chunks,
-            embedding=self.embeddings
+    def embed_chunks(self, processed_chunks, progress_callback=None, batch_size=256):
+        """Create FAISS vector store from processed document chunks, reusing cached embeddings"""
+        total = len(processed_chunks)
+        return self.embed_stream(
+            processed_chunks,
+            on_batch=(lambda vector_store, done: progress_callback(done, total)) if progress_callback else None,
+            batch_size=batch_size,
         )
 
-        retriever = vector_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 4}
-        )
+    def embed_stream(self, chunks, on_batch=None, batch_size=None, index_id=None, vector_store=None, rebuild=False):
+        """Embed an iterable of chunks in fixed-size batches, appending each batch to the index
+
+        Only one batch is held at a time, so peak memory does not grow with the document.
+        on_batch(vector_store, chunks_embedded) is called after every batch; the store is
+        already searchable at that point. A new store is created under index_id unless an
+        existing vector_store is given to append to; rebuild=True replaces what is stored there.
+        """
+        chunks = iter(chunks)
+        batch_size = batch_size or self.backend.insert_batch_size
+        chunks_embedded = 0
+
+        while True:
+            batch = list(islice(chunks, batch_size))
+            if not batch:
+                break
+
+            if self.parity_check_pending:
+                self.check_parity([chunk.page_content for chunk in batch])
+
+            if vector_store is None:
+                vector_store = self.backend.create(index_id, batch, self.embeddings, rebuild=rebuild)
+            else:
+                vector_store.add_documents(batch)
+
+            chunks_embedded += len(batch)
+            if on_batch:
+                on_batch(vector_store, chunks_embedded)
+
+        if vector_store is None:
+            raise ValueError("No text could be extracted from the PDF")
+
+        retriever = self.build_retriever(vector_store)
 
         return retriever, vector_store 
-    
-    
-        
 
-          
-     
+    def check_parity(self, texts):
+        """Compare the configured (quantized / ONNX) backend against fp32 PyTorch on real chunks"""
+        self.parity_check_pending = False
+        if self.base_embeddings.backend == "torch":
+            return None
+        reference = EmbeddingEngine(self.model_name, backend="torch")
+        # Chunk openings stand in for user questions about those chunks
+        queries = [" ".join(text.split()[:12]) for text in texts[:32]]
+        report = parity_check(reference, self.base_embeddings, texts, queries)
+        print(f"Embedding parity ({self.base_embeddings.backend} vs torch): {report}")
+        return report
+
+    @metrics.span("index_optimize")
+    def optimize_index(self, vector_store):
+        """Swap the store's index for the configured ANN / compressed type as the corpus grows or shrinks
+
+        The new index is built from the original embeddings and only adopted if it reaches
+        ANN_MIN_RECALL; otherwise the next more exact type is tried. Returns the adopted index's
+        report (recall@k against exact search), or None if the index was kept.
+        """
+        from classes.faissStore import LockedFAISS
+        if not isinstance(vector_store, LockedFAISS):
+            return None  # Other backends manage their own index structure
+        with vector_store._lock:
+            index = vector_store.index
+            docstore_ids = dict(vector_store.index_to_docstore_id)
+            current = index_type_of(index)
+            target = choose_index_type(index.ntotal, self.index_type, current)
+            # A type that missed the recall floor is retried once the corpus has grown by a quarter
+            while target != current and index.ntotal < 1.25 * vector_store.rejected_index_types.get(target, 0):
+                target = FALLBACK_INDEX_TYPES.get(target, "flat")
+            if target == current:
+                return None
+            vectors, texts = self.original_vectors(vector_store)
+
+        # Re-embedding, training and the recall check run unlocked, so searches and appends are not held up
+        if vectors is None:
+            vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+            if vector_store._normalize_L2:
+                faiss.normalize_L2(vectors)
+        rejected = []
+        while True:
+            candidate, report = convert_index(vectors, target)
+            if report["meets_min_recall"] or target not in FALLBACK_INDEX_TYPES:
+                break
+            print(f"Index type {target} rejected: {report}")
+            vector_store.rejected_index_types[target] = len(vectors)
+            rejected.append(target)
+            target = FALLBACK_INDEX_TYPES[target]
+            if target == current:
+                return None
+        report["rejected"] = rejected
 
+        with vector_store._lock:
+            # Chunks added or deleted meanwhile are not in the candidate; the next optimize picks them up
+            if (vector_store.index is not index or vector_store.index.ntotal != len(vectors)
+                    or vector_store.index_to_docstore_id != docstore_ids):
+                print("Index changed during conversion; keeping the current index")
+                return None
+            vector_store.index = candidate
+            vector_store.is_mmapped = False
+        print(f"Index converted: {report}")
+        return report
+
+    def original_vectors(self, vector_store):
+        """The store's vectors in position order as embedded, not as a quantized index approximates them
+
+        Returns (vectors, None), or (None, texts) when the index is quantized: its codes cannot be
+        turned back into the embeddings, but the chunk texts can be re-embedded, mostly from the cache.
+        Call with the store's lock held.
+        """
+        index = vector_store.index
+        if index_type_of(index) not in LOSSY_INDEX_TYPES:
+            return reconstruct_all(index), None
+        return None, [vector_store.docstore.search(vector_store.index_to_docstore_id[position]).page_content
+                      for position in range(index.ntotal)]
+
+    def build_retriever(self, vector_store):
+        """Create the retriever used by the RAG chain: vector + BM25 legs fused by reciprocal rank"""
+        return HybridRetriever(
+            vector_store=vector_store,
+            k=int(os.getenv("RETRIEVER_K", 4)),
+            k_vector=int(os.getenv("RETRIEVER_K_VECTOR", 8)),
+            k_lexical=int(os.getenv("RETRIEVER_K_LEXICAL", 8)),
+        )
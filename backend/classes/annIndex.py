@@ -0,0 +1,282 @@
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+# Corpus sizes (number of chunk vectors) at which "auto" switches index type
+HNSW_MIN_VECTORS = int(os.getenv("HNSW_MIN_VECTORS", 20_000))
+IVFPQ_MIN_VECTORS = int(os.getenv("IVFPQ_MIN_VECTORS", 200_000))
+
+INDEX_TYPES = ("flat", "fp16", "hnsw", "hnsw_fp16", "ivf", "ivfpq")
+
+# IVF needs ~40 points per centroid; PQ needs ~40 points per 256-entry codebook
+MIN_TRAINING_VECTORS = {"ivf": 1_000, "ivfpq": 10_000}
+MAX_TRAINING_VECTORS = int(os.getenv("ANN_MAX_TRAINING_VECTORS", 100_000))
+
+# Filtered IVF searches probe every list when the filter keeps less than this share of the vectors
+FILTER_EXHAUSTIVE_FRACTION = float(os.getenv("FILTER_EXHAUSTIVE_FRACTION", 0.1))
+
+# Lowest recall@4 against exact search an index is adopted with; search is widened, then a more
+# exact type tried (FALLBACK_INDEX_TYPES), until it is reached
+MIN_RECALL = float(os.getenv("ANN_MIN_RECALL", 0.9))
+FALLBACK_INDEX_TYPES = {"ivfpq": "hnsw", "hnsw_fp16": "hnsw", "ivf": "hnsw", "hnsw": "flat", "fp16": "flat"}
+MAX_EF_SEARCH = 1024
+
+# Types whose stored vectors only approximate the embeddings; they are never the source of a new index
+LOSSY_INDEX_TYPES = ("fp16", "hnsw_fp16", "ivfpq")
+
+# "auto" keeps an index until the corpus shrinks below this share of the size that selected it
+DOWNGRADE_FRACTION = float(os.getenv("ANN_DOWNGRADE_FRACTION", 0.5))
+AUTO_MIN_VECTORS = {"flat": 0, "hnsw": HNSW_MIN_VECTORS, "ivfpq": IVFPQ_MIN_VECTORS}
+
+
+def choose_index_type(n_vectors, requested="auto", current=None):
+    """Pick an index type for a corpus size; an explicit request wins unless the corpus is too small to train it
+
+    With "auto", an index of type current is kept while the corpus is above DOWNGRADE_FRACTION of
+    the size that selected it, so deletes around a threshold do not rebuild it back and forth.
+    """
+    if requested != "auto":
+        if requested not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {requested}")
+        if n_vectors < MIN_TRAINING_VECTORS.get(requested, 0):
+            return "flat"  # Not enough vectors to train centroids / codebooks
+        return requested
+    if n_vectors >= IVFPQ_MIN_VECTORS:
+        target = "ivfpq"
+    elif n_vectors >= HNSW_MIN_VECTORS:
+        target = "hnsw"
+    else:
+        target = "flat"
+    if (current in AUTO_MIN_VECTORS and AUTO_MIN_VECTORS[target] < AUTO_MIN_VECTORS[current]
+            and n_vectors >= AUTO_MIN_VECTORS[current] * DOWNGRADE_FRACTION):
+        return current
+    return target
+
+
+def factory_string(index_type, n_vectors, dim):
+    """faiss.index_factory description for an index type"""
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "fp16":
+        return "SQfp16"
+    if index_type == "hnsw":
+        return "HNSW32"
+    if index_type == "hnsw_fp16":
+        return "HNSW32,SQfp16"
+
+    # Roughly 4 * sqrt(n) centroids, with at least ~40 training points per centroid
+    nlist = max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 40))
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivfpq":
+        # 8-dim sub-vectors, one byte each: 384 floats (1536 bytes) become 48 bytes
+        m = next(m for m in (dim // 8, dim // 4, dim // 2, dim) if m and dim % m == 0)
+        return f"IVF{nlist},PQ{m}"
+    raise ValueError(f"Unknown index type: {index_type}")
+
+
+def tune_search(index, nprobe=None, ef_search=None):
+    """Set query-time accuracy knobs (IVF nprobe, HNSW efSearch)
+
+    Without explicit values the configured ones are a minimum: an index widened by widen_search
+    to reach MIN_RECALL keeps its stored, higher setting when it is loaded again.
+    """
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = int(nprobe or max(ivf.nprobe, int(os.getenv("IVF_NPROBE", 16))))
+    except RuntimeError:
+        pass
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = int(ef_search or max(index.hnsw.efSearch, int(os.getenv("HNSW_EF_SEARCH", 64))))
+
+
+def filtered_search(index, vectors, k, ids):
+    """Search only the vectors at positions ids, using a faiss IDSelector instead of post-filtering
+
+    When the selection is a small part of the corpus, IVF probes every list and HNSW widens its beam
+    so the filter does not starve the results; if the index still returns fewer than k, the selected
+    vectors are scanned exactly.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) == 0:
+        return np.zeros((len(vectors), 0), dtype=np.float32), np.zeros((len(vectors), 0), dtype=np.int64)
+    selector = faiss.IDSelectorBatch(ids)
+    fraction = len(ids) / max(1, index.ntotal)
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+    if ivf is not None:
+        nprobe = ivf.nlist if fraction < FILTER_EXHAUSTIVE_FRACTION else ivf.nprobe
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    elif hasattr(index, "hnsw"):
+        ef_search = min(MAX_EF_SEARCH, max(index.hnsw.efSearch, int(index.hnsw.efSearch / fraction)))
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    distances, found = index.search(vectors, k, params=params)
+
+    if (found >= 0).sum(axis=1).min() < min(k, len(ids)):
+        try:
+            selected = index.reconstruct_batch(ids)
+        except RuntimeError:
+            return distances, found
+        distances, positions = faiss.knn(vectors, selected, min(k, len(ids)), metric=index.metric_type)
+        found = ids[positions]
+    return distances, found
+
+
+def reconstruct_all(index):
+    """Stored vectors of any index as an (n, d) float32 array (approximate for quantized indexes)"""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    ivf = None
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        ivf.make_direct_map()
+    except RuntimeError:
+        ivf = None
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    finally:
+        if ivf is not None:
+            # The direct map costs memory and blocks remove_ids, so drop it again
+            ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+
+
+def compact_ivf_labels(index, removed):
+    """Renumber an IVF index's labels after remove_ids so they are positions 0..ntotal-1 again
+
+    Flat indexes shift later vectors down on removal, and LangChain's FAISS.delete renumbers its
+    position -> docstore id map to match; IVF lists keep their original labels, so they are shifted
+    here the same way. Codes are copied as stored, so nothing is re-quantized.
+    """
+    ivf = faiss.extract_index_ivf(index)
+    removed = np.sort(np.asarray(removed, dtype=np.int64))
+    invlists = ivf.invlists
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if not size:
+            continue
+        labels = faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy()
+        codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), size * invlists.code_size).copy()
+        labels -= np.searchsorted(removed, labels)
+        invlists.update_entries(list_no, 0, size, faiss.swig_ptr(labels), faiss.swig_ptr(codes))
+
+
+def build_index(vectors, index_type):
+    """Train (if needed) and fill a new index of the given type"""
+    n_vectors, dim = vectors.shape
+    index = faiss.index_factory(dim, factory_string(index_type, n_vectors, dim), faiss.METRIC_L2)
+    if not index.is_trained:
+        # Training cost grows with the sample, not the corpus, so cap it
+        rng = np.random.default_rng(0)
+        sample = vectors
+        if n_vectors > MAX_TRAINING_VECTORS:
+            sample = vectors[rng.choice(n_vectors, size=MAX_TRAINING_VECTORS, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    tune_search(index)
+    return index
+
+
+def refill(index, vectors):
+    """Empty copy of index (same type and trained state) filled with vectors"""
+    rebuilt = faiss.clone_index(index)
+    rebuilt.reset()
+    if len(vectors):
+        rebuilt.add(vectors)
+    tune_search(rebuilt)
+    return rebuilt
+
+
+def index_type_of(index) -> str:
+    """Index type name (as in INDEX_TYPES) of a built or loaded index"""
+    if hasattr(index, "hnsw"):
+        return "hnsw_fp16" if isinstance(index, faiss.IndexHNSWSQ) else "hnsw"
+    try:
+        ivf = faiss.downcast_index(faiss.extract_index_ivf(index))
+        return "ivfpq" if isinstance(ivf, faiss.IndexIVFPQ) else "ivf"
+    except RuntimeError:
+        pass
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "fp16"
+    return "flat"
+
+
+def recall_at_k(reference, candidate, queries, k=4):
+    """Mean fraction of the reference index's top-k neighbours that the candidate also returns"""
+    if len(queries) == 0:
+        return 1.0
+    k = min(k, reference.ntotal)
+    _, expected = reference.search(queries, k)
+    _, found = candidate.search(queries, k)
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found))
+    return hits / (len(queries) * k)
+
+
+def index_memory_bytes(index) -> int:
+    """Approximate size of the vectors held by an index"""
+    try:
+        code_size = index.sa_code_size()
+    except RuntimeError:
+        code_size = index.d * 4
+    graph = 2 * 32 * 4 if hasattr(index, "hnsw") else 0  # HNSW32 base-layer links, int32 each
+    return index.ntotal * (code_size + graph)
+
+
+def widen_search(index, baseline, queries, k=4, min_recall=MIN_RECALL):
+    """Double IVF nprobe / HNSW efSearch until recall@k against baseline reaches min_recall; returns the recall"""
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        ivf = None
+    recall = recall_at_k(baseline, index, queries, k)
+    while recall < min_recall:
+        if ivf is not None and ivf.nprobe < ivf.nlist:
+            ivf.nprobe = min(ivf.nlist, ivf.nprobe * 2)
+        elif hasattr(index, "hnsw") and index.hnsw.efSearch < MAX_EF_SEARCH:
+            index.hnsw.efSearch = min(MAX_EF_SEARCH, index.hnsw.efSearch * 2)
+        else:
+            break
+        recall = recall_at_k(baseline, index, queries, k)
+    return recall
+
+
+def convert_index(vectors, index_type, sample_queries=200, k=4, min_recall=MIN_RECALL):
+    """Build vectors into a new index_type index and report its recall@k against exact search
+
+    vectors must be the original embeddings, not ones read back from a quantized index: the
+    baseline is built from them, and a lossy source would only be compared with itself. Search is
+    widened towards min_recall; report["meets_min_recall"] says whether it got there.
+    """
+    start = time.perf_counter()
+    candidate = build_index(vectors, index_type)
+
+    # Queries near stored vectors approximate real question/chunk neighbourhoods
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(vectors), size=min(sample_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + rng.normal(0, 0.01, size=(len(picks), vectors.shape[1])).astype(np.float32)
+    baseline = faiss.IndexFlatL2(vectors.shape[1])
+    baseline.add(vectors)
+    recall = widen_search(candidate, baseline, queries, k, min_recall)
+
+    report = {
+        "index_type": index_type,
+        "vectors": int(len(vectors)),
+        f"recall@{k}": round(recall, 4),
+        "meets_min_recall": recall >= min_recall,
+        "flat_bytes": int(index_memory_bytes(baseline)),
+        "index_bytes": int(index_memory_bytes(candidate)),
+        "build_seconds": round(time.perf_counter() - start, 3),
+    }
+    try:
+        report["nprobe"] = int(faiss.extract_index_ivf(candidate).nprobe)
+    except RuntimeError:
+        pass
+    if hasattr(candidate, "hnsw"):
+        report["ef_search"] = int(candidate.hnsw.efSearch)
+    return candidate, report
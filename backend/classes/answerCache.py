@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from classes.metrics import metrics
+
+
+class CachedAnswer:
+    def __init__(self, question, vector, answer, context):
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.context = context
+        self.created_at = time.monotonic()
+
+
+class SemanticAnswerCache:
+    """Per-document answer cache looked up by cosine similarity of standalone-question embeddings"""
+
+    def __init__(self, embeddings, threshold=None, ttl_seconds=None, max_entries=None):
+        self.embeddings = embeddings
+        self.threshold = float(threshold or os.getenv("ANSWER_CACHE_THRESHOLD", 0.92))
+        self.ttl_seconds = float(ttl_seconds or os.getenv("ANSWER_CACHE_TTL_SECONDS", 3600))
+        self.max_entries = int(max_entries or os.getenv("ANSWER_CACHE_MAX_ENTRIES", 256))  # per document
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # doc_id -> OrderedDict of CachedAnswer, oldest first
+        self._lock = threading.Lock()
+
+    def embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @metrics.span("answer_cache_lookup")
+    def lookup(self, doc_id, question):
+        """Return (cached answer or None, question vector); the vector can be passed to store()"""
+        vector = self.embed(question)
+        with self._lock:
+            entries = self._entries.get(doc_id)
+            self._expire(entries)
+            if entries:
+                keys = list(entries.keys())
+                matrix = np.stack([entries[key].vector for key in keys])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return entries[keys[best]], vector
+            self.misses += 1
+            return None, vector
+
+    def store(self, doc_id, question, vector, answer, context):
+        with self._lock:
+            entries = self._entries.setdefault(doc_id, OrderedDict())
+            entries[question.strip().lower()] = CachedAnswer(question, vector, answer, context)
+            entries.move_to_end(question.strip().lower())
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def _expire(self, entries):
+        if not entries:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        for key in [key for key, entry in entries.items() if entry.created_at < cutoff]:
+            del entries[key]
+
+    def invalidate(self, doc_id):
+        """Forget cached answers after a document's index changes, including document-subset scopes"""
+        with self._lock:
+            for key in [key for key in self._entries if key == doc_id or key.startswith(f"{doc_id}|")]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "documents": len(self._entries),
+                "entries": sum(len(entries) for entries in self._entries.values()),
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+            }
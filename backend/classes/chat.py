@@ -1,4 +1,6 @@
 
+import asyncio
+import json
 from langchain_core.messages import HumanMessage, AIMessage
 
 
@@ -6,23 +8,125 @@ class ChatRAG:
     def __init__(self):
         """Initialize the ChatRAG - will be configured with existing RAG chain"""
         self.conversational_rag_chain = None
+        self.answer_cache = None
+        self.question_rewriter = None
+        self.cache_key = None
 
-    def initialize_chain(self, conversational_rag_chain):
-        """Initialize with an already created conversational RAG chain"""
+    def initialize_chain(self, conversational_rag_chain, answer_cache=None, question_rewriter=None, cache_key=None):
+        """Initialize with an already created conversational RAG chain
+
+        If answer_cache is given, answers are cached under cache_key (the document id) and looked up
+        by the standalone question from question_rewriter.
+        """
         self.conversational_rag_chain = conversational_rag_chain
+        self.answer_cache = answer_cache
+        self.question_rewriter = question_rewriter
+        self.cache_key = cache_key
     
-    def get_answer(self, question, chat_history):
+    def _chain_input(self, question, chat_history, standalone):
+        chain_input = {"input": question, "chat_history": chat_history}
+        if standalone is not None:
+            # Lets the retriever reuse the already computed standalone question
+            chain_input["standalone_input"] = standalone
+        return chain_input
+
+    def _scoped(self, retrieval_filter):
+        """(answer cache key, chain config) for a request restricted by retrieval_filter, if any
+
+        retrieval_filter is {"doc_ids": [...], "tags": [...]}; cached answers are only reused for
+        the same document subset.
+        """
+        if not retrieval_filter:
+            return self.cache_key, None
+        cache_key = f"{self.cache_key}|{json.dumps(retrieval_filter, sort_keys=True)}"
+        return cache_key, {"metadata": {"retrieval_filter": retrieval_filter}}
+
+    def _lookup_cached(self, question, chat_history, cache_key):
+        """Return (cached answer or None, standalone question, question vector)"""
+        if self.answer_cache is None:
+            return None, None, None
+        standalone = question
+        if self.question_rewriter is not None:
+            standalone = self.question_rewriter.standalone_question({"input": question, "chat_history": chat_history})
+        cached, vector = self.answer_cache.lookup(cache_key, standalone)
+        return cached, standalone, vector
+
+    async def _alookup_cached(self, question, chat_history, cache_key):
+        if self.answer_cache is None:
+            return None, None, None
+        standalone = question
+        if self.question_rewriter is not None:
+            standalone = await self.question_rewriter.astandalone_question({"input": question, "chat_history": chat_history})
+        cached, vector = await asyncio.to_thread(self.answer_cache.lookup, cache_key, standalone)
+        return cached, standalone, vector
+
+    def get_answer(self, question, chat_history, retrieval_filter=None):
         """Get an answer from the RAG system"""
         if not self.conversational_rag_chain:
             raise ValueError("RAG chain is not initialized. Please create it first using initialize_chain().")
         
-        result = self.conversational_rag_chain.invoke({
-            "input": question,
-            "chat_history": chat_history
-        })
+        cache_key, config = self._scoped(retrieval_filter)
+        cached, standalone, vector = self._lookup_cached(question, chat_history, cache_key)
+        if cached is not None:
+            print(f"Answer cache hit for: {standalone}")
+            return {"input": question, "chat_history": chat_history,
+                    "answer": cached.answer, "context": cached.context, "cached": True}
+
+        result = self.conversational_rag_chain.invoke(self._chain_input(question, chat_history, standalone), config=config)
+
+        if self.answer_cache is not None:
+            self.answer_cache.store(cache_key, standalone, vector, result["answer"], result.get("context", []))
         
         return result
-    
+
+    async def aget_answer(self, question, chat_history, retrieval_filter=None):
+        """Async get_answer: the LLM calls run on the event loop instead of blocking it"""
+        if not self.conversational_rag_chain:
+            raise ValueError("RAG chain is not initialized. Please create it first using initialize_chain().")
+
+        cache_key, config = self._scoped(retrieval_filter)
+        cached, standalone, vector = await self._alookup_cached(question, chat_history, cache_key)
+        if cached is not None:
+            print(f"Answer cache hit for: {standalone}")
+            return {"input": question, "chat_history": chat_history,
+                    "answer": cached.answer, "context": cached.context, "cached": True}
+
+        result = await self.conversational_rag_chain.ainvoke(self._chain_input(question, chat_history, standalone),
+                                                             config=config)
+
+        if self.answer_cache is not None:
+            self.answer_cache.store(cache_key, standalone, vector, result["answer"], result.get("context", []))
+
+        return result
+
+    async def astream_answer(self, question, chat_history, retrieval_filter=None):
+        """Stream an answer: yields ("sources", list) and ("citations", list) once retrieval finishes, then ("token", str) chunks"""
+        if not self.conversational_rag_chain:
+            raise ValueError("RAG chain is not initialized. Please create it first using initialize_chain().")
+
+        cache_key, config = self._scoped(retrieval_filter)
+        cached, standalone, vector = await self._alookup_cached(question, chat_history, cache_key)
+        if cached is not None:
+            yield "sources", self.extract_sources({"context": cached.context})
+            yield "citations", self.extract_citations({"context": cached.context})
+            yield "token", cached.answer
+            return
+
+        context = []
+        answer_parts = []
+        async for chunk in self.conversational_rag_chain.astream(self._chain_input(question, chat_history, standalone),
+                                                                 config=config):
+            if "context" in chunk:
+                context = chunk["context"]
+                yield "sources", self.extract_sources(chunk)
+                yield "citations", self.extract_citations(chunk)
+            if chunk.get("answer"):
+                answer_parts.append(chunk["answer"])
+                yield "token", chunk["answer"]
+
+        if self.answer_cache is not None:
+            self.answer_cache.store(cache_key, standalone, vector, "".join(answer_parts), context)
+
     def get_updated_history(self, chat_history, result):
         """Update chat history with the latest question and answer"""
         chat_history.extend([
@@ -46,6 +150,23 @@ class ChatRAG:
             sources.append(source_text)
         
         return sources
+
+    def extract_citations(self, result):
+        """Where each source chunk sits in its document: pages spanned and character offsets"""
+        citations = []
+        for doc in result.get("context") or []:
+            metadata = doc.metadata
+            citations.append({
+                "doc_id": metadata.get("doc_id"),
+                "page": metadata.get("page"),
+                # Chunks indexed before document-level chunking lie on a single page and have no offsets
+                "page_end": metadata.get("page_end", metadata.get("page")),
+                "page_label": metadata.get("page_label"),
+                "page_offset": metadata.get("page_offset"),
+                "start_offset": metadata.get("start_offset"),
+                "end_offset": metadata.get("end_offset"),
+            })
+        return citations
     
     def convert_history_to_strings(self, chat_history):
         """Convert message history to list of strings"""
@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from langchain_core.messages import HumanMessage, AIMessage
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)"""
+    return len(text) // 4 + 1
+
+
+class Conversation:
+    def __init__(self, doc_id=None):
+        self.conversation_id = uuid.uuid4().hex
+        self.doc_id = doc_id
+        self.messages = []
+        self.updated_at = time.monotonic()
+
+
+class ConversationStore:
+    """Server-side chat history keyed by conversation id, trimmed to a token budget"""
+
+    def __init__(self, max_conversations=None, history_token_budget=None, max_messages=None, idle_ttl_seconds=None):
+        self.max_conversations = int(max_conversations or os.getenv("MAX_CONVERSATIONS", 10_000))
+        self.history_token_budget = int(history_token_budget or os.getenv("HISTORY_TOKEN_BUDGET", 1500))
+        self.max_messages = int(max_messages or os.getenv("MAX_STORED_MESSAGES", 100))
+        self.idle_ttl_seconds = float(idle_ttl_seconds or os.getenv("CONVERSATION_TTL_SECONDS", 24 * 3600))
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, doc_id=None) -> Conversation:
+        conversation = Conversation(doc_id)
+        with self._lock:
+            self._conversations[conversation.conversation_id] = conversation
+            self._expire()
+        return conversation
+
+    def get(self, conversation_id):
+        with self._lock:
+            self._expire()
+            conversation = self._conversations.get(conversation_id)
+            if conversation is not None:
+                conversation.updated_at = time.monotonic()
+                self._conversations.move_to_end(conversation_id)
+            return conversation
+
+    def delete(self, conversation_id):
+        with self._lock:
+            return self._conversations.pop(conversation_id, None) is not None
+
+    def window(self, conversation):
+        """Most recent whole question/answer turns that fit in the history token budget"""
+        with self._lock:
+            messages = list(conversation.messages)
+
+        window = []
+        used = 0
+        # Walk back one turn (question + answer) at a time
+        for end in range(len(messages), 0, -2):
+            turn = messages[max(0, end - 2):end]
+            cost = sum(estimate_tokens(msg.content) for msg in turn)
+            if used + cost > self.history_token_budget:
+                break
+            window = turn + window
+            used += cost
+        return window
+
+    def append_turn(self, conversation, question, answer):
+        with self._lock:
+            conversation.messages.extend([HumanMessage(content=question), AIMessage(content=answer)])
+            # Older turns never make it into the prompt window, so don't keep them forever
+            if len(conversation.messages) > self.max_messages:
+                del conversation.messages[:len(conversation.messages) - self.max_messages]
+            conversation.updated_at = time.monotonic()
+            self._conversations.move_to_end(conversation.conversation_id)
+
+    def _expire(self):
+        """Drop idle conversations and the oldest ones beyond max_conversations"""
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        while self._conversations:
+            conversation_id, conversation = next(iter(self._conversations.items()))
+            if conversation.updated_at >= cutoff and len(self._conversations) <= self.max_conversations:
+                break
+            self._conversations.pop(conversation_id)
+
+    def __len__(self):
+        return len(self._conversations)
@@ -0,0 +1,137 @@
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+from typing import Iterable, Iterator, List
+
+import numpy as np
+from langchain_core.documents import Document
+
+from classes.metrics import metrics
+
+DIGITS = re.compile(r"\d+")
+WORDS = re.compile(r"\w+")
+BIT_POSITIONS = np.arange(64, dtype=np.uint64)
+
+
+def _line_key(line):
+    """Compare lines ignoring case, spacing and numbers, so "Page 3 of 40" matches "Page 4 of 40" """
+    return " ".join(DIGITS.sub("#", line).lower().split())
+
+
+def _hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class BoilerplateStripper:
+    """Removes running headers, footers and page numbers: lines repeated at the edges of many pages
+
+    learn() looks at a window of raw pages (with their line breaks); strip() then drops matching lines
+    from the top and bottom of each page. Lines in the middle of a page are never touched.
+    """
+
+    def __init__(self, window_pages=None, edge_lines=3, min_ratio=0.5):
+        self.window_pages = int(window_pages or os.getenv("BOILERPLATE_WINDOW_PAGES", 8))
+        self.edge_lines = edge_lines
+        self.min_ratio = min_ratio  # Share of window pages a line must appear on
+        self.lines = None  # Keys of boilerplate lines, once learned
+        self.removed = 0
+
+    @property
+    def ready(self):
+        return self.lines is not None
+
+    def learn(self, texts: List[str]):
+        counts = Counter()
+        for text in texts:
+            lines = text.split("\n")
+            counts.update({_line_key(lines[i]) for i in self._edge_indexes(lines)})
+        needed = max(2, math.ceil(self.min_ratio * len(texts)))
+        self.lines = {key for key, count in counts.items() if count >= needed and key}
+        if self.lines:
+            print(f"Stripping {len(self.lines)} repeated header/footer line(s)")
+
+    def strip(self, text: str) -> str:
+        if not self.lines:
+            return text
+        lines = text.split("\n")
+        drop = {i for i in self._edge_indexes(lines) if _line_key(lines[i]) in self.lines}
+        if not drop:
+            return text
+        self.removed += len(drop)
+        metrics.inc("rag_boilerplate_lines_removed_total", len(drop))
+        return "\n".join(line for i, line in enumerate(lines) if i not in drop)
+
+    def _edge_indexes(self, lines):
+        nonempty = [i for i, line in enumerate(lines) if line.strip()]
+        return set(nonempty[:self.edge_lines] + nonempty[-self.edge_lines:])
+
+
+class ChunkDeduplicator:
+    """Drops chunks that repeat an earlier chunk exactly or almost exactly
+
+    Exact repeats are caught by a hash of the normalized text. Near repeats are found with a 64-bit
+    SimHash over word shingles: a chunk within max_distance bits of an earlier one is dropped, which
+    catches copies that differ in punctuation, a shifted chunk boundary or a word of a long chunk.
+    Only chunks with the same numbers in the same order are compared, so chunks that differ in a
+    value (a date, an amount, a table row) are always kept.
+    One instance covers one ingestion; removed_exact and removed_near count what it dropped.
+    """
+
+    def __init__(self, max_distance=None, shingle_words=3):
+        self.max_distance = int(max_distance if max_distance is not None else os.getenv("DEDUP_MAX_HAMMING", 3))
+        self.shingle_words = shingle_words
+        self.seen = set()
+        self.fingerprints = {}  # (hash of the chunk's numbers, band, band bits) -> SimHash fingerprints
+        self.removed_exact = 0
+        self.removed_near = 0
+
+    def filter(self, chunks: Iterable[Document]) -> Iterator[Document]:
+        for chunk in chunks:
+            if not self.is_duplicate(chunk.page_content):
+                yield chunk
+
+    def is_duplicate(self, text: str) -> bool:
+        """True if text repeats an earlier one; otherwise remembers it"""
+        normalized = " ".join(text.lower().split())
+        exact_key = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+        if exact_key in self.seen:
+            self.removed_exact += 1
+            return True
+
+        # Only chunks with the same numbers are candidates, so a changed value is never taken for noise
+        # however close the fingerprints are
+        numbers = " ".join(DIGITS.findall(normalized))
+        numbers_key = hashlib.blake2b(numbers.encode("utf-8"), digest_size=16).digest()
+        fingerprint = self.simhash(WORDS.findall(normalized))
+        keys = self._band_keys(numbers_key, fingerprint)
+        if any(bin(fingerprint ^ other).count("1") <= self.max_distance
+               for key in keys for other in self.fingerprints.get(key, ())):
+            self.removed_near += 1
+            return True
+
+        self.seen.add(exact_key)
+        for key in keys:
+            self.fingerprints.setdefault(key, []).append(fingerprint)
+        return False
+
+    def _band_keys(self, numbers_key, fingerprint):
+        """Keys for max_distance + 1 bit ranges of the fingerprint
+
+        Fingerprints within max_distance bits of each other agree exactly on at least one range, so
+        only those sharing a key are compared instead of every earlier chunk.
+        """
+        bands = self.max_distance + 1
+        bounds = [64 * i // bands for i in range(bands + 1)]
+        return [(numbers_key, band, (fingerprint >> low) & ((1 << (high - low)) - 1))
+                for band, (low, high) in enumerate(zip(bounds, bounds[1:]))]
+
+    def simhash(self, words: List[str]) -> int:
+        size = self.shingle_words
+        shingles = [" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))]
+        hashes = np.fromiter((_hash64(shingle) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+        # Each bit is set if most shingle hashes have it set
+        votes = ((hashes[:, None] >> BIT_POSITIONS) & np.uint64(1)).sum(axis=0)
+        bits = (votes * 2 > len(shingles)).astype(np.uint64)
+        return int((bits << BIT_POSITIONS).sum())
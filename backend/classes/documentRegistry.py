@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from classes.chat import ChatRAG
+from classes.annIndex import index_memory_bytes
+
+
+def estimate_memory_bytes(vector_store) -> int:
+    """Rough resident size of a FAISS vector store: vectors (unless memory-mapped) plus chunk text"""
+    if not hasattr(vector_store, "index"):
+        return 0  # Disk-backed stores (Chroma) keep vectors and text out of process memory
+    total = 0
+    index = vector_store.index
+    if not getattr(vector_store, "is_mmapped", False):
+        total += index_memory_bytes(index)
+    for doc in getattr(vector_store.docstore, "_dict", {}).values():
+        total += len(doc.page_content) + 200  # text plus metadata overhead
+    return total
+
+
+class DocumentSession:
+    """Retrieval state and chat chain for one processed document"""
+
+    def __init__(self, doc_id, vector_store, retriever, conversational_rag_chain,
+                 answer_cache=None, question_rewriter=None):
+        self.doc_id = doc_id
+        self.vector_store = vector_store
+        self.retriever = retriever
+        self.conversational_rag_chain = conversational_rag_chain
+        self.chat_rag = ChatRAG()
+        self.chat_rag.initialize_chain(conversational_rag_chain, answer_cache=answer_cache,
+                                       question_rewriter=question_rewriter, cache_key=doc_id)
+        self.memory_bytes = estimate_memory_bytes(vector_store)
+        self.last_used = time.monotonic()
+
+    def refresh_memory(self):
+        """Re-estimate memory after the vector store has grown"""
+        self.memory_bytes = estimate_memory_bytes(self.vector_store)
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+
+class DocumentRegistry:
+    """Bounded registry of loaded document sessions with LRU eviction of idle indexes"""
+
+    def __init__(self, max_documents=None, memory_budget_mb=None):
+        self.max_documents = int(max_documents or os.getenv("MAX_LOADED_DOCUMENTS", 8))
+        self.memory_budget_bytes = int(memory_budget_mb or os.getenv("DOCUMENT_MEMORY_BUDGET_MB", 1024)) * 1024 * 1024
+        self.default_doc_id = None  # Most recently uploaded document, used when a request has no doc_id
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, doc_id):
+        """Return the loaded session for doc_id (marking it recently used), or None"""
+        with self._lock:
+            session = self._sessions.get(doc_id)
+            if session is not None:
+                self._sessions.move_to_end(doc_id)
+                session.touch()
+            return session
+
+    def put(self, session):
+        """Register a session and evict idle ones beyond the count or memory budget"""
+        with self._lock:
+            self._sessions[session.doc_id] = session
+            self._sessions.move_to_end(session.doc_id)
+            session.touch()
+            return self._evict()
+
+    def remove(self, doc_id, session=None):
+        """Unregister doc_id; with session given, only if that exact session is still the one registered"""
+        with self._lock:
+            if session is not None and self._sessions.get(doc_id) is not session:
+                return None
+            return self._sessions.pop(doc_id, None)
+
+    def memory_bytes(self) -> int:
+        return sum(session.memory_bytes for session in self._sessions.values())
+
+    def _evict(self):
+        """Drop least recently used sessions; the newest one is always kept"""
+        evicted = []
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_documents
+            or self.memory_bytes() > self.memory_budget_bytes
+        ):
+            doc_id, _ = self._sessions.popitem(last=False)
+            evicted.append(doc_id)
+        if evicted:
+            print(f"Evicted idle documents: {[doc_id[:12] for doc_id in evicted]}")
+        return evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "loaded_documents": len(self._sessions),
+                "max_documents": self.max_documents,
+                "memory_bytes": self.memory_bytes(),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "documents": [
+                    {
+                        "doc_id": session.doc_id,
+                        "memory_bytes": session.memory_bytes,
+                        "idle_seconds": round(now - session.last_used, 1),
+                    }
+                    for session in reversed(self._sessions.values())
+                ],
+            }
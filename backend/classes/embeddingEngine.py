@@ -0,0 +1,136 @@
+import os
+import threading
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from classes.metrics import metrics
+
+# torch: fp32 PyTorch (same vectors as HuggingFaceEmbeddings)
+# int8:  PyTorch with dynamically quantized Linear layers
+# onnx:  ONNX Runtime (needs `pip install sentence-transformers[onnx]`)
+EMBEDDING_BACKENDS = ("torch", "int8", "onnx")
+
+
+class EmbeddingEngine(Embeddings):
+    """CPU sentence-transformers embedder with length-bucketed batches and optional quantization"""
+
+    def __init__(self, model_name="all-MiniLM-L6-v2", backend=None, batch_size=None, threads=None, processes=None):
+        self.model_name = model_name
+        self.backend = backend or os.getenv("EMBEDDING_BACKEND", "torch")
+        if self.backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {self.backend}")
+        self.batch_size = int(batch_size or os.getenv("EMBEDDING_BATCH_SIZE", 64))
+        self.threads = int(threads or os.getenv("EMBEDDING_THREADS", 0))  # 0 = torch default (all cores)
+        self.processes = int(processes or os.getenv("EMBEDDING_PROCESSES", 1))
+        self._pool = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The model is loaded on first use (or by warm_up) so the server can start without it"""
+        with self._lock:
+            if self._model is None:
+                self._model = self._load_model()
+            return self._model
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    def warm_up(self):
+        """Load the model and run one encode so the first real request doesn't pay for either"""
+        self.embed_query("warm up")
+
+    @property
+    def cache_name(self) -> str:
+        """Name for embedding cache keys; quantized vectors must not mix with fp32 ones"""
+        return self.model_name if self.backend == "torch" else f"{self.model_name}:{self.backend}"
+
+    def _load_model(self):
+        # torch and sentence_transformers take seconds to import
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if self.threads:
+            torch.set_num_threads(self.threads)
+
+        if self.backend == "onnx":
+            try:
+                return SentenceTransformer(self.model_name, device="cpu", backend="onnx")
+            except (ImportError, TypeError, ValueError) as e:
+                print(f"ONNX backend unavailable ({e}), using PyTorch")
+                self.backend = "torch"
+
+        model = SentenceTransformer(self.model_name, device="cpu")
+        if self.backend == "int8":
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    @metrics.span("embed")
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = [text.replace("\n", " ") for text in texts]
+        if not texts:
+            return []
+        metrics.inc("rag_embedded_texts_total", len(texts))
+
+        # Sort by length so each batch (and each worker's shard) pads to similar lengths,
+        # then restore the input order
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        sorted_texts = [texts[i] for i in order]
+
+        if self.processes > 1 and len(texts) >= self.processes * self.batch_size:
+            vectors = self._encode_sharded(sorted_texts)
+        else:
+            vectors = self._encode(sorted_texts)
+
+        result = np.empty_like(vectors)
+        result[order] = vectors
+        return result.tolist()
+
+    @metrics.span("embed_query")
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text.replace("\n", " ")])[0].tolist()
+
+    def _encode(self, texts):
+        return self.model.encode(texts, batch_size=self.batch_size, show_progress_bar=False, convert_to_numpy=True)
+
+    def _encode_sharded(self, sorted_texts):
+        """Spread batches over worker processes; each worker gets runs of similar-length texts"""
+        if self._pool is None:
+            self._pool = self.model.start_multi_process_pool(["cpu"] * self.processes)
+        return self.model.encode_multi_process(
+            sorted_texts, self._pool, batch_size=self.batch_size, chunk_size=self.batch_size * 4
+        )
+
+    def close(self):
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+
+def parity_check(reference: Embeddings, candidate: Embeddings, texts, queries, k=4,
+                 min_cosine=0.98, min_overlap=0.9) -> dict:
+    """Compare a candidate embedder with the reference: per-text cosine and top-k retrieval overlap"""
+    def normalized(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    ref_docs, cand_docs = normalized(reference.embed_documents(texts)), normalized(candidate.embed_documents(texts))
+    cosines = np.sum(ref_docs * cand_docs, axis=1)
+
+    ref_queries = normalized([reference.embed_query(query) for query in queries])
+    cand_queries = normalized([candidate.embed_query(query) for query in queries])
+    k = min(k, len(texts))
+    ref_top = np.argsort(-(ref_queries @ ref_docs.T), axis=1)[:, :k]
+    cand_top = np.argsort(-(cand_queries @ cand_docs.T), axis=1)[:, :k]
+    overlap = np.mean([len(set(r) & set(c)) / k for r, c in zip(ref_top, cand_top)])
+
+    return {
+        "min_cosine": round(float(cosines.min()), 4),
+        "mean_cosine": round(float(cosines.mean()), 4),
+        f"top{k}_overlap": round(float(overlap), 4),
+        "passed": bool(cosines.min() >= min_cosine and overlap >= min_overlap),
+    }
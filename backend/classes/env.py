@@ -0,0 +1,10 @@
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Fix .env path resolution - look for .env in project root
+current_dir = Path(__file__).parent
+project_root = current_dir.parent.parent  # Go up to RAG project root
+env_path = project_root / '.env'
+
+# Imported once by the entry points, before any module reads its settings
+load_dotenv(env_path)
@@ -0,0 +1,159 @@
+import threading
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from classes.annIndex import compact_ivf_labels, filtered_search, index_type_of, reconstruct_all, refill
+from classes.hybridRetriever import BM25Index
+from classes.metrics import metrics
+
+
+class LockedFAISS(FAISS):
+    """FAISS store that can be searched while new batches are still being appended
+
+    Also keeps a BM25 index over the same chunks for lexical retrieval, and per-document posting
+    lists (document id -> vector positions, tag -> document ids) so searches can be restricted to
+    some documents before ranking.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.RLock()
+        self.lexical_index = BM25Index()
+        self.doc_vectors = {}
+        self.tag_docs = {}
+        self.rejected_index_types = {}  # Index type -> corpus size at which it missed ANN_MIN_RECALL
+
+    def rebuild_lexical_index(self):
+        """Index every chunk in the docstore (after from_documents or loading from disk)"""
+        with self._lock:
+            self.lexical_index = BM25Index()
+            for docstore_id in self.index_to_docstore_id.values():
+                self.lexical_index.add(docstore_id, self.docstore.search(docstore_id).page_content)
+            self.rebuild_postings()
+
+    def rebuild_postings(self):
+        """Recompute the posting lists from chunk metadata (positions shift when vectors are deleted)"""
+        with self._lock:
+            self.doc_vectors = {}
+            self.tag_docs = {}
+            for position, docstore_id in self.index_to_docstore_id.items():
+                self._post(position, self.docstore.search(docstore_id).metadata)
+
+    def _post(self, position, metadata):
+        doc_id = metadata.get("doc_id")
+        self.doc_vectors.setdefault(doc_id, set()).add(position)
+        for tag in metadata.get("tags") or ():
+            self.tag_docs.setdefault(tag, set()).add(doc_id)
+
+    def count(self) -> int:
+        return self.index.ntotal
+
+    def chunk_ids(self, doc_id):
+        """Docstore ids of every chunk that belongs to doc_id"""
+        with self._lock:
+            return [self.index_to_docstore_id[position] for position in sorted(self.doc_vectors.get(doc_id, ()))]
+
+    def documents(self) -> dict:
+        """Chunk count per document id in the store"""
+        with self._lock:
+            return {doc_id: len(positions) for doc_id, positions in self.doc_vectors.items()}
+
+    def document_tags(self, doc_id):
+        with self._lock:
+            return sorted(tag for tag, doc_ids in self.tag_docs.items() if doc_id in doc_ids)
+
+    def tags(self) -> set:
+        """Every tag carried by a document in the store"""
+        with self._lock:
+            return set(self.tag_docs)
+
+    def get_documents(self, ids):
+        with self._lock:
+            return [self.docstore.search(docstore_id) for docstore_id in ids]
+
+    def update_metadata(self, ids, metadatas):
+        """Replace the metadata of stored chunks without touching their vectors"""
+        with self._lock:
+            for docstore_id, metadata in zip(ids, metadatas):
+                self.docstore.search(docstore_id).metadata = metadata
+            self.rebuild_postings()
+
+    def select(self, doc_ids=None, tags=None):
+        """Vector positions of the chunks in doc_ids and/or documents carrying any of tags"""
+        with self._lock:
+            selected = set(self.doc_vectors) if doc_ids is None else set(doc_ids)
+            if tags is not None:
+                selected &= set().union(*(self.tag_docs.get(tag, ()) for tag in tags))
+            return set().union(*(self.doc_vectors.get(doc_id, ()) for doc_id in selected))
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        # Embed outside the lock so searches only wait for the index append itself
+        texts = list(texts)
+        embeddings = self._embed_documents(texts)
+        return self.add_embeddings(zip(texts, embeddings), metadatas=metadatas, ids=ids, **kwargs)
+
+    @metrics.span("index_add")
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs):
+        text_embeddings = list(text_embeddings)
+        with self._lock:
+            start = len(self.index_to_docstore_id)
+            ids = super().add_embeddings(text_embeddings, metadatas=metadatas, ids=ids, **kwargs)
+            for position, (docstore_id, (text, _)) in enumerate(zip(ids, text_embeddings), start):
+                self.lexical_index.add(docstore_id, text)
+                self._post(position, metadatas[position - start] if metadatas else {})
+            return ids
+
+    def delete(self, ids=None, **kwargs):
+        with self._lock:
+            for docstore_id in ids or []:
+                doc = self.docstore.search(docstore_id)
+                if isinstance(doc, Document):
+                    self.lexical_index.remove(docstore_id, doc.page_content)
+            removed = None
+            if index_type_of(self.index) in ("ivf", "ivfpq"):
+                positions = {docstore_id: position for position, docstore_id in self.index_to_docstore_id.items()}
+                removed = [positions[docstore_id] for docstore_id in ids or [] if docstore_id in positions]
+            try:
+                result = super().delete(ids=ids, **kwargs)
+                if removed:
+                    compact_ivf_labels(self.index, removed)
+                return result
+            except RuntimeError:
+                # HNSW indexes cannot remove vectors in place: delete from a flat copy, then rebuild
+                ann_index = self.index
+                self.index = faiss.IndexFlatL2(ann_index.d)
+                self.index.add(reconstruct_all(ann_index))
+                try:
+                    return super().delete(ids=ids, **kwargs)
+                finally:
+                    self.index = refill(ann_index, reconstruct_all(self.index))
+            finally:
+                self.rebuild_postings()
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, fetch_k=20,
+                                               doc_ids=None, tags=None, **kwargs):
+        """doc_ids / tags restrict the search to those documents' vectors before ranking"""
+        with self._lock:
+            if doc_ids is None and tags is None:
+                return super().similarity_search_with_score_by_vector(embedding, k, filter=filter,
+                                                                      fetch_k=fetch_k, **kwargs)
+            vector = np.array([embedding], dtype=np.float32)
+            if self._normalize_L2:
+                faiss.normalize_L2(vector)
+            scores, positions = filtered_search(self.index, vector, k, sorted(self.select(doc_ids, tags)))
+            return [
+                (self.docstore.search(self.index_to_docstore_id[position]), score)
+                for position, score in zip(positions[0], scores[0]) if position != -1
+            ]
+
+    def lexical_search(self, query, k=8, doc_ids=None, tags=None):
+        """Top-k chunks by BM25 score, optionally only from doc_ids / documents with tags"""
+        with self._lock:
+            allowed = None
+            if doc_ids is not None or tags is not None:
+                allowed = {self.index_to_docstore_id[position] for position in self.select(doc_ids, tags)}
+            return [self.docstore.search(docstore_id)
+                    for docstore_id, _ in self.lexical_index.search(query, k, allowed=allowed)]
@@ -0,0 +1,122 @@
+import math
+import re
+from collections import Counter
+from typing import Any, List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from classes.metrics import metrics
+
+# Keeps identifiers such as "part-1234", "7.3.1" or "ISO/IEC" together as one term
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-./_][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase terms, plus the pieces of compound identifiers so "1234" also matches "part-1234" """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(re.split(r"[-./_]", token))
+    return terms
+
+
+class BM25Index:
+    """Compact in-memory inverted index with Okapi BM25 scoring"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {doc_id: term frequency}
+        self.doc_lengths = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc_id, text):
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id, text)
+        terms = Counter(tokenize(text))
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        length = sum(terms.values())
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+
+    def remove(self, doc_id, text):
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in set(tokenize(text)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, query, k=8, allowed=None):
+        """Top-k (doc_id, score) pairs, only among ids in allowed if given"""
+        if not self.doc_lengths:
+            return []
+        n_docs = len(self.doc_lengths)
+        avg_length = self.total_length / n_docs
+        scores = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(ranked_lists, rrf_k=60):
+    """Fuse ranked lists of ids: score(id) = sum of 1 / (rrf_k + rank)"""
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """Vector similarity and BM25 over the same chunks, combined with reciprocal rank fusion
+
+    A "retrieval_filter" ({"doc_ids": [...], "tags": [...]}) in the run config metadata restricts
+    both legs to those documents.
+    """
+
+    vector_store: Any
+    k: int = 4
+    k_vector: int = 8
+    k_lexical: int = 8
+    rrf_k: int = 60
+
+    @metrics.span("retrieval")
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        scope = run_manager.metadata.get("retrieval_filter") or {}
+        scope = {key: scope[key] for key in ("doc_ids", "tags") if scope.get(key) is not None}
+        vector_docs = self.vector_store.similarity_search(query, k=self.k_vector, **scope)
+        lexical_docs = []
+        if hasattr(self.vector_store, "lexical_search"):
+            lexical_docs = self.vector_store.lexical_search(query, k=self.k_lexical, **scope)
+
+        by_id = {}
+        ranked_lists = []
+        for docs in (vector_docs, lexical_docs):
+            ranked = []
+            for doc in docs:
+                key = doc.id or doc.page_content
+                by_id.setdefault(key, doc)
+                ranked.append(key)
+            ranked_lists.append(ranked)
+
+        return [by_id[key] for key in reciprocal_rank_fusion(ranked_lists, self.rrf_k)[:self.k]]
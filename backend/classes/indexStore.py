@@ -0,0 +1,135 @@
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+import faiss
+
+from classes.annIndex import tune_search
+from classes.metrics import metrics
+
+# Indexes live next to the project by default - look for .cache in project root
+current_dir = Path(__file__).parent
+project_root = current_dir.parent.parent  # Go up to RAG project root
+default_store_dir = project_root / '.cache' / 'indexes'
+
+# Map flat codes straight from disk when this faiss build supports it
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class IdLocks:
+    """One lock per index id, so writes to the same index are serialized and others run in parallel"""
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, index_id) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(index_id, threading.Lock())
+
+
+class IndexStore:
+    """Persist FAISS indexes and their docstores on disk, keyed by document content hash"""
+
+    def __init__(self, store_dir=None):
+        self.store_dir = Path(store_dir or os.getenv("INDEX_STORE_DIR", default_store_dir))
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.locks = IdLocks()
+
+    @staticmethod
+    def hash_file(file_path, block_size=1 << 20) -> str:
+        """Content hash of a file, used as the document id"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def path_for(self, doc_id: str) -> Path:
+        return self.store_dir / doc_id
+
+    def exists(self, doc_id: str) -> bool:
+        path = self.path_for(doc_id)
+        return (path / "index.faiss").exists() and (path / "index.pkl").exists()
+
+    @metrics.span("index_save")
+    def save(self, doc_id: str, vector_store: "LockedFAISS"):
+        """Write the index and docstore (same layout as FAISS.save_local) and swap it in atomically"""
+        target = self.path_for(doc_id)
+        # Ingestion threads can save the same id (the corpus above all) at once, so the write and swap
+        # hold the id's lock; the temporary directory is unique too, for other processes on the store
+        with self.locks(doc_id):
+            tmp = Path(tempfile.mkdtemp(dir=self.store_dir, prefix=f".{doc_id}."))
+            old = None
+            try:
+                faiss.write_index(vector_store.index, str(tmp / "index.faiss"))
+                with open(tmp / "index.pkl", "wb") as f:
+                    pickle.dump((vector_store.docstore, vector_store.index_to_docstore_id), f)
+
+                if target.exists():
+                    old = Path(tempfile.mkdtemp(dir=self.store_dir, prefix=f".{doc_id}.old-"))
+                    target.rename(old / doc_id)
+                tmp.rename(target)
+            except BaseException:
+                if old is not None and not target.exists():
+                    (old / doc_id).rename(target)
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise
+            if old is not None:
+                shutil.rmtree(old, ignore_errors=True)
+
+    @metrics.span("index_load")
+    def load(self, doc_id: str, embeddings, mmap=True) -> "LockedFAISS":
+        """Load a stored index, memory-mapping the vectors so RAM stays flat as the corpus grows"""
+        path = self.path_for(doc_id)
+        # Not while a save is swapping the directory
+        with self.locks(doc_id):
+            index = None
+            if mmap:
+                try:
+                    index = faiss.read_index(str(path / "index.faiss"), MMAP_FLAGS)
+                except RuntimeError:
+                    index = None
+            if index is None:
+                mmap = False
+                index = faiss.read_index(str(path / "index.faiss"))
+
+            with open(path / "index.pkl", "rb") as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+
+        tune_search(index)
+
+        # Imported here: langchain_community is slow to import and not needed until an index is used
+        from classes.faissStore import LockedFAISS
+        vector_store = LockedFAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+        )
+        vector_store.is_mmapped = mmap
+        # The BM25 index is cheap to rebuild from the docstore, so it is not stored
+        vector_store.rebuild_lexical_index()
+        return vector_store
+
+    @staticmethod
+    def ensure_writable(vector_store: "LockedFAISS") -> "LockedFAISS":
+        """Replace a memory-mapped (read-only) index with an in-memory copy before mutating it"""
+        if getattr(vector_store, "is_mmapped", False):
+            vector_store.index = faiss.deserialize_index(faiss.serialize_index(vector_store.index))
+            vector_store.is_mmapped = False
+        return vector_store
+
+    def list_documents(self):
+        """Stored document ids, most recently saved first"""
+        doc_ids = [path.name for path in self.store_dir.iterdir() if not path.name.startswith(".")]
+        doc_ids = [doc_id for doc_id in doc_ids if self.exists(doc_id)]
+        return sorted(doc_ids, key=lambda doc_id: self.path_for(doc_id).stat().st_mtime, reverse=True)
+
+    def delete(self, doc_id: str):
+        with self.locks(doc_id):
+            shutil.rmtree(self.path_for(doc_id), ignore_errors=True)
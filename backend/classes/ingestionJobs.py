@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class IngestionJob:
+    """Status and progress of one background document ingestion"""
+
+    def __init__(self, filename=None):
+        self.job_id = uuid.uuid4().hex
+        self.filename = filename
+        self.stage = "queued"
+        self.progress = {}
+        self.doc_id = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+        self._lock = threading.Lock()
+
+    def update(self, stage=None, **progress):
+        """Record the current stage and any progress counters (pages_parsed, chunks_embedded, ...)"""
+        with self._lock:
+            if stage is not None:
+                self.stage = stage
+            self.progress.update(progress)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "filename": self.filename,
+                "stage": self.stage,
+                "progress": dict(self.progress),
+                "doc_id": self.doc_id,
+                "error": self.error,
+                "elapsed_seconds": round((self.finished_at or time.time()) - self.created_at, 2),
+            }
+
+
+class JobManager:
+    """Runs ingestion off the event loop: a thread pool orchestrates jobs and a process pool parses PDFs"""
+
+    def __init__(self, max_workers=None, max_parse_workers=None, max_jobs=1000):
+        self.thread_pool = ThreadPoolExecutor(
+            max_workers=int(max_workers or os.getenv("INGEST_WORKERS", 2)),
+            thread_name_prefix="ingest",
+        )
+        self.parse_workers = int(max_parse_workers or os.getenv("INGEST_PARSE_PROCESSES", 2))
+        self.process_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Start the parse processes now, before the embedding model is loaded into this process"""
+        futures = [self.process_pool.submit(os.getpid) for _ in range(self.parse_workers)]
+        for future in futures:
+            future.result()
+
+    def submit(self, fn, *args, filename=None) -> IngestionJob:
+        """Run fn(job, *args) in the background and return the job immediately"""
+        job = IngestionJob(filename)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            # Forget the oldest finished jobs so the table stays bounded
+            while len(self._jobs) > self.max_jobs:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if oldest.finished_at is None:
+                    break
+                self._jobs.pop(oldest_id)
+        job.future = self.thread_pool.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        try:
+            result = fn(job, *args)
+            job.update(stage="ready")
+            return result
+        except Exception as e:
+            print(f"Ingestion job {job.job_id} failed: {str(e)}")
+            job.error = str(e)
+            job.update(stage="failed")
+            raise
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self):
+        """Cancel queued jobs and stop the parse processes"""
+        self.thread_pool.shutdown(wait=False, cancel_futures=True)
+        # Without waiting, interpreter exit can close the pool's pipes under its management thread
+        # (OSError: Bad file descriptor)
+        self.process_pool.shutdown(wait=True, cancel_futures=True)
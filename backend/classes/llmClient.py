@@ -0,0 +1,124 @@
+import asyncio
+import os
+import threading
+import weakref
+from typing import AsyncIterator, Iterator, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from classes.metrics import llm_metrics_handler
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+
+# One slot per in-flight LLM request, shared by every chain in the process
+_sync_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+_async_slots = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+
+
+def async_slots() -> asyncio.Semaphore:
+    """The LLM concurrency semaphore for the running event loop"""
+    loop = asyncio.get_running_loop()
+    slots = _async_slots.get(loop)
+    if slots is None:
+        slots = _async_slots[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return slots
+
+
+def create_llm(model_name="Gemma2-9b-It"):
+    """Chat model for LLM_PROVIDER: "groq" (default) or "stub" (local, no network)"""
+    provider = os.getenv("LLM_PROVIDER", "groq")
+    if provider == "stub":
+        return StubChatModel(callbacks=[llm_metrics_handler])
+    if provider != "groq":
+        raise ValueError(f"Unknown LLM provider: {provider}")
+    return _create_groq(model_name)
+
+
+def _create_groq(model_name):
+    import httpx
+    from langchain_groq import ChatGroq
+
+    class PooledChatGroq(ChatGroq):
+        """ChatGroq whose requests wait for a free concurrency slot"""
+
+        def _generate(self, *args, **kwargs):
+            with _sync_slots:
+                return super()._generate(*args, **kwargs)
+
+        async def _agenerate(self, *args, **kwargs):
+            async with async_slots():
+                return await super()._agenerate(*args, **kwargs)
+
+        def _stream(self, *args, **kwargs):
+            with _sync_slots:
+                yield from super()._stream(*args, **kwargs)
+
+        async def _astream(self, *args, **kwargs):
+            async with async_slots():
+                async for chunk in super()._astream(*args, **kwargs):
+                    yield chunk
+
+    timeout = float(os.getenv("LLM_TIMEOUT_SECONDS", 30))
+    # Keep-alive connections are reused across requests instead of a TLS handshake per call
+    limits = httpx.Limits(max_connections=LLM_MAX_CONCURRENCY * 2, max_keepalive_connections=LLM_MAX_CONCURRENCY)
+    return PooledChatGroq(
+        groq_api_key=os.getenv("GROQ_API_KEY"),
+        model_name=model_name,
+        request_timeout=timeout,
+        # The Groq SDK retries 429s and 5xx with exponential backoff, honouring Retry-After
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", 3)),
+        http_client=httpx.Client(limits=limits, timeout=timeout),
+        http_async_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+        # Times each call and counts tokens, see classes/metrics.py
+        callbacks=[llm_metrics_handler],
+    )
+
+
+class StubChatModel(BaseChatModel):
+    """Deterministic local chat model for tests and benchmarks
+
+    Answers with the start of the system prompt's retrieved context, and returns the question
+    unchanged for question-reformulation prompts. LLM_STUB_LATENCY_MS simulates a remote call.
+    """
+
+    latency_seconds: float = float(os.getenv("LLM_STUB_LATENCY_MS", 0)) / 1000
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        system = next((msg.content for msg in messages if isinstance(msg, SystemMessage)), "")
+        question = messages[-1].content if messages else ""
+        if "standalone question" in system:
+            return question
+        context = system.split("concise.", 1)[-1].split()
+        return "Based on the document: " + " ".join(context[:40]) if context else "I don't know."
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_seconds:
+            threading.Event().wait(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        if self.latency_seconds:
+            threading.Event().wait(self.latency_seconds)
+        for token in self._tokens(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        for token in self._tokens(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def _tokens(self, messages) -> List[str]:
+        words = self._reply(messages).split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
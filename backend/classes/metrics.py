@@ -0,0 +1,182 @@
+import contextvars
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from classes.conversationStore import estimate_tokens
+
+# Seconds; covers per-page parsing up to multi-second LLM calls
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Stage timings of the current HTTP request, for the Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+# Observations made inside metrics.collect(), which worker processes hand back to the parent
+_collected = contextvars.ContextVar("collected_observations", default=None)
+
+
+def _label_string(labels):
+    return ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+
+class Metrics:
+    """Process-wide stage timings and counters, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> [bucket counts, count, sum]
+        self._counters = {}  # (name, labels) -> value
+
+    def _histogram(self, name, labels, seconds):
+        key = (name, _label_string(labels))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, [[0] * len(BUCKETS), 0, 0.0])
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += 1
+            histogram[2] += seconds
+
+    def observe(self, stage, seconds):
+        """Record one duration for a pipeline stage"""
+        self._histogram("rag_stage_seconds", {"stage": stage}, seconds)
+        collected = _collected.get()
+        if collected is not None:
+            collected.append((stage, seconds))
+
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def observe_request(self, method, route, status_code, seconds):
+        self._histogram("rag_http_request_seconds", {"method": method, "route": route}, seconds)
+        self.inc("rag_http_requests_total", method=method, route=route, status=status_code)
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_string(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def collect(self):
+        """Also list the (stage, seconds) observations made inside the block, for a worker process to return"""
+        observations = []
+        token = _collected.set(observations)
+        try:
+            yield observations
+        finally:
+            _collected.reset(token)
+
+    @contextmanager
+    def request_timings(self):
+        """Collect the stage timings of everything run inside the block (across threads and tasks)"""
+        timings = {}
+        token = _request_timings.set(timings)
+        try:
+            yield timings
+        finally:
+            _request_timings.reset(token)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        for name in sorted({name for (name, _), _ in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (hist_name, labels), (buckets, count, total) in histograms:
+                if hist_name != name:
+                    continue
+                for bound, bucket_count in zip(BUCKETS, buckets):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {count}")
+
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (counter_name, labels), value in counters:
+                if counter_name == name:
+                    lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+        lines.append("# TYPE process_peak_rss_bytes gauge")
+        lines.append(f"process_peak_rss_bytes {peak_rss_bytes()}")
+        return "\n".join(lines) + "\n"
+
+
+def peak_rss_bytes() -> int:
+    """High-water mark of this process's resident memory"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KiB
+
+
+def server_timing_header(timings) -> str:
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Times LLM calls by tag ("rewrite", "generation") and counts prompt/completion tokens"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self._starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        prompt_estimate = sum(estimate_tokens(str(msg.content)) for batch in messages for msg in batch)
+        self._starts[run_id] = (time.perf_counter(), self._stage(tags), prompt_estimate)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None, **kwargs):
+        prompt_estimate = sum(estimate_tokens(prompt) for prompt in prompts)
+        self._starts[run_id] = (time.perf_counter(), self._stage(tags), prompt_estimate)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start, stage, prompt_estimate = self._starts.pop(run_id, (None, "llm", 0))
+        if start is not None:
+            self.metrics.observe(stage, time.perf_counter() - start)
+
+        prompt_tokens, completion_tokens = self._token_usage(response)
+        prompt_tokens = prompt_tokens or prompt_estimate
+        self.metrics.inc("rag_llm_tokens_total", prompt_tokens, stage=stage, kind="prompt")
+        self.metrics.inc("rag_llm_tokens_total", completion_tokens, stage=stage, kind="completion")
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        _, stage, _ = self._starts.pop(run_id, (None, "llm", 0))
+        self.metrics.inc("rag_llm_errors_total", stage=stage)
+
+    @staticmethod
+    def _stage(tags):
+        return next((tag for tag in tags or [] if tag in ("rewrite", "generation")), "llm")
+
+    @staticmethod
+    def _token_usage(response):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage_metadata:
+                    prompt_tokens += usage_metadata.get("input_tokens", 0)
+                    completion_tokens += usage_metadata.get("output_tokens", 0)
+                else:
+                    # Streaming responses and local models may not report usage; estimate it
+                    completion_tokens += estimate_tokens(generation.text)
+        return prompt_tokens, completion_tokens
+
+
+metrics = Metrics()
+llm_metrics_handler = LLMMetricsHandler(metrics)
@@ -1,83 +1,269 @@
 import os
-from pathlib import Path
-from dotenv import load_dotenv
-
-# Fix .env path resolution - look for .env in project root
-current_dir = Path(__file__).parent
-project_root = current_dir.parent.parent  # Go up to RAG project root
-env_path = project_root / '.env'
-load_dotenv(env_path)
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import re
 from langchain_core.documents import Document
-from typing import List
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfReader
+from typing import Iterator, List
+import math
+from classes.dedup import BoilerplateStripper
+from classes.metrics import metrics
+from classes.textSplitter import DocumentChunker, OffsetTextSplitter
+
+# Presentation-form ligatures PDFs often contain; soft hyphens are only line-break hints
+LIGATURES = (
+    ("\ufb00", "ff"), ("\ufb01", "fi"), ("\ufb02", "fl"), ("\ufb03", "ffi"), ("\ufb04", "ffl"),
+    ("\ufb05", "st"), ("\ufb06", "st"), ("\u00ad", ""),
+)
+# Whitespace str.split() splits on besides " " and "\n" (the last code point of it is U+3000)
+OTHER_WHITESPACE = "".join(chr(c) for c in range(0x3001) if chr(c).isspace() and chr(c) not in " \n")
+OTHER_ASCII_WHITESPACE = "".join(c for c in OTHER_WHITESPACE if c.isascii())
+# A word broken with a hyphen at the end of a line and continued in lowercase on the next; the literal
+# "-\n" prefix lets the regex engine jump between line-end hyphens instead of testing every character
+HYPHENATED_LINE_BREAK = re.compile(r"-\n\s*(?=[a-z])")
+SOFT_HYPHEN_LINE_BREAK = re.compile(r"\u00ad[ \t]*\r?\n\s*(?=[a-z])")
+
+
+def _join_line_break(match):
+    """Replacement for a hyphen (or soft hyphen) line break after a letter
+
+    The hyphen is dropped ("infor-\nmation"), unless the word already contains one: then it is a
+    compound split at its hyphen ("state-of-the-\nart") and only the line break goes.
+    """
+    text, start = match.string, match.start()
+    if start == 0 or not text[start - 1].isalpha():
+        return match.group()
+    if text[start] == "-":
+        word_start = max(text.rfind(" ", 0, start), text.rfind("\n", 0, start), text.rfind("\t", 0, start)) + 1
+        if "-" in text[word_start:start]:
+            return "-"
+    return ""
 
 
 
 
 class PDFProcessor:
     
-    def __init__(self, chunk_size=1000, chunk_overlap=100):
+    def __init__(self, chunk_size=1000, chunk_overlap=100, strip_boilerplate=None):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.text_splitter = RecursiveCharacterTextSplitter(
+        if strip_boilerplate is None:
+            strip_boilerplate = os.getenv("STRIP_BOILERPLATE", "1") == "1"
+        self.strip_boilerplate = strip_boilerplate
+        # Same chunks as RecursiveCharacterTextSplitter, computed on offsets
+        self.text_splitter = OffsetTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             separators=["\n\n", "\n", " ", ""],
         )
+        self.chunker = DocumentChunker(self.text_splitter)
 
     def process_pdf(self,pdf_path:str)->List[Document]:
         """Process PDF with smart chunking and metadata enhancement"""
+        return list(self.iter_chunks(pdf_path))
 
-        # Laod PDF
+    def iter_pages(self, pdf_path: str) -> Iterator[Document]:
+        """Yield pages one at a time instead of loading the whole PDF"""
+        # langchain_community is slow to import, so only pay for it once a PDF arrives
+        from langchain_community.document_loaders import PyPDFLoader
 
+        # Laod PDF lazily
         loader=PyPDFLoader(pdf_path)
-        pages=loader.load()
+        yield from loader.lazy_load()
+
+    def iter_chunks(self, pdf_path: str, progress_callback=None) -> Iterator[Document]:
+        """Yield chunks of the whole document as pages stream in; progress_callback(pages_done, total_pages) runs after each page"""
+        return self.chunker.chunk_pages(self._clean_pages(self._iter_raw_pages(pdf_path, progress_callback)))
 
+    def _iter_raw_pages(self, pdf_path, progress_callback=None):
         ## Process each page
+        pages = self.iter_pages(pdf_path)
+        page_num = 0
+        while True:
+            with metrics.span("pdf_load"):
+                page = next(pages, None)
+            if page is None:
+                break
+            total_pages = page.metadata["total_pages"]
+            yield page.page_content, page.metadata, page_num, total_pages
+            if progress_callback:
+                progress_callback(page_num + 1, total_pages)
+            page_num += 1
 
-        processed_chunks=[]
+    def _clean_pages(self, raw_pages) -> Iterator[tuple]:
+        """Strip repeated headers/footers and clean (text, metadata, page_num, total_pages) pages
 
-        for page_num,page in enumerate(pages):
-            ## clean text
-            cleaned_text=self._clean_text(page.page_content)
+        Headers and footers are learned from the first window of pages, so only that window is held back.
+        """
+        stripper = BoilerplateStripper() if self.strip_boilerplate else None
+        window = []
+        for raw_page in raw_pages:
+            if stripper is None or stripper.ready:
+                ready = [raw_page]
+            else:
+                window.append(raw_page)
+                if len(window) < stripper.window_pages:
+                    continue
+                stripper.learn([text for text, *_ in window])
+                ready, window = window, []
+            for text, metadata, page_num, total_pages in ready:
+                if stripper is not None:
+                    text = stripper.strip(text)
+                cleaned = self._clean_page(text, metadata, page_num, total_pages)
+                if cleaned is not None:
+                    yield cleaned
 
-            # Skip nearly empty pages
-            if len(cleaned_text.strip()) < 50:
-                continue
+        if window:
+            # Documents shorter than the window
+            stripper.learn([text for text, *_ in window])
+            for text, metadata, page_num, total_pages in window:
+                cleaned = self._clean_page(stripper.strip(text), metadata, page_num, total_pages)
+                if cleaned is not None:
+                    yield cleaned
+        if stripper is not None and stripper.removed:
+            print(f"Removed {stripper.removed} header/footer lines")
 
-            # Create chunks with enhanced metadata
-            chunks = self.text_splitter.create_documents(
-                texts=[cleaned_text],
-                metadatas=[{
-                    **page.metadata,
-                    "page": page_num + 1,
-                    "total_pages": len(pages),
-                    "chunk_method": "smart_pdf_processor",
-                    "char_count": len(cleaned_text)
-                }]
-            )
-            
-            processed_chunks.extend(chunks)
+    def process_pdf_parallel(self, pdf_path: str, executor=None, max_workers=None,
+                             pages_per_shard=None, progress_callback=None) -> List[Document]:
+        """Process PDF by sharding page ranges across a process pool, merging pages in order
 
-        return processed_chunks
+        Produces the same chunks and metadata as process_pdf.
+        """
+        return list(self.iter_chunks_parallel(pdf_path, executor, max_workers,
+                                              pages_per_shard, progress_callback))
 
-    def _clean_text(self, text: str) -> str:
-        """Clean extracted text"""
-        # Remove excessive whitespace
-        text = " ".join(text.split())
-        
-        # Fix common PDF extraction issues
-        text = text.replace("ﬁ", "fi")
-        text = text.replace("ﬂ", "fl")
-        
-        return text
+    def iter_chunks_parallel(self, pdf_path: str, executor=None, max_workers=None,
+                             pages_per_shard=None, progress_callback=None) -> Iterator[Document]:
+        """Yield chunks in page order while page-range shards are extracted in a process pool
 
+        Only a bounded window of shards is in flight, so memory stays flat for long PDFs. Text extraction
+        dominates; cleaning and chunking run here, over the pages in order, so header/footer detection
+        sees the whole document and chunks can cross shard boundaries.
+        progress_callback(pages_done, total_pages) is called as shards are consumed.
+        """
+        return self.chunker.chunk_pages(self._clean_pages(self._iter_raw_pages_parallel(
+            pdf_path, executor, max_workers, pages_per_shard, progress_callback
+        )))
 
+    def _iter_raw_pages_parallel(self, pdf_path, executor, max_workers, pages_per_shard, progress_callback):
+        # Reading the first page gives the document-level metadata PyPDFLoader attaches to every page
+        first_page = next(self.iter_pages(pdf_path), None)
+        if first_page is None:
+            return
+        total_pages = first_page.metadata["total_pages"]
+        base_metadata = {
+            key: value for key, value in first_page.metadata.items()
+            if key not in ("page", "page_label")
+        }
 
+        # A few shards per worker keeps the pool busy when page lengths are uneven
+        workers = max_workers or os.cpu_count() or 1
+        pages_per_shard = pages_per_shard or max(1, math.ceil(total_pages / (workers * 4)))
+        shards = [
+            (start, min(start + pages_per_shard, total_pages))
+            for start in range(0, total_pages, pages_per_shard)
+        ]
 
-        
+        if len(shards) == 1:
+            pages, _ = _extract_page_range(pdf_path, 0, total_pages, base_metadata)
+            yield from pages
+            if progress_callback:
+                progress_callback(total_pages, total_pages)
+            return
+
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=workers)
+
+        try:
+            pending = deque()
+            next_shard = 0
+            while next_shard < len(shards) or pending:
+                # Keep up to two shards per worker in flight
+                while next_shard < len(shards) and len(pending) < workers * 2:
+                    start, end = shards[next_shard]
+                    pending.append((end, executor.submit(
+                        _extract_page_range, pdf_path, start, end, base_metadata,
+                    )))
+                    next_shard += 1
+
+                end, future = pending.popleft()
+                pages, observations = future.result()
+                # Stage timings from the worker process
+                for stage, seconds in observations:
+                    metrics.observe(stage, seconds)
+                yield from pages
+                if progress_callback:
+                    progress_callback(end, total_pages)
+        finally:
+            if own_executor:
+                executor.shutdown(cancel_futures=True)
+
+    def _clean_page(self, page_text, page_metadata, page_num, total_pages):
+        """Clean one page; returns (text, metadata) or None for nearly empty pages"""
+        metrics.inc("rag_pages_total")
+        ## clean text
+        with metrics.span("clean"):
+            cleaned_text=self._clean_text(page_text)
+
+        # Skip nearly empty pages
+        if len(cleaned_text.strip()) < 50:
+            return None
+
+        return cleaned_text, {
+            **page_metadata,
+            "page": page_num + 1,
+            "total_pages": total_pages,
+            "chunk_method": "smart_pdf_processor",
+            "char_count": len(cleaned_text),
+        }
+
+    def _clean_text(self, text: str) -> str:
+        """Clean extracted text: re-join hyphenated line breaks, expand ligatures, collapse whitespace"""
+        # Same result as " ".join(text.split()) plus the replacements, but faster: substring search and
+        # str.replace run at memchr speed, while split/join, regex callbacks and str.translate (on
+        # non-ASCII text) touch every word or character from Python-level machinery.
+        # Most pages have no line-end hyphen (pypdf ends lines with "\n"), so the regexes rarely run.
+        ascii_only = text.isascii()  # O(1): CPython records it on the string
+        if "-\n" in text:
+            text = HYPHENATED_LINE_BREAK.sub(_join_line_break, text)
+        if not ascii_only and "\u00ad" in text:
+            text = SOFT_HYPHEN_LINE_BREAK.sub(_join_line_break, text)
+        if not ascii_only:
+            for ligature, replacement in LIGATURES:
+                if ligature in text:
+                    text = text.replace(ligature, replacement)
+        for space in OTHER_ASCII_WHITESPACE if ascii_only else OTHER_WHITESPACE:
+            if space in text:
+                text = text.replace(space, " ")
+        text = text.replace("\n", " ")
+        # Each pass halves every run of spaces
+        while "  " in text:
+            text = text.replace("  ", " ")
+        return text.strip(" ")
+
+
+def _extract_page_range(pdf_path, start, end, base_metadata):
+    """Extract the text of pages [start, end) - runs in a worker process
+
+    Returns (text, metadata, page_num, total_pages) per page and the stage timings recorded meanwhile.
+    """
+    with metrics.collect() as observations:
+        reader = PdfReader(pdf_path)
+        total_pages = len(reader.pages)
 
+        pages = []
+        for page_num in range(start, end):
+            # Same extraction and page metadata PyPDFLoader uses
+            with metrics.span("pdf_load"):
+                page_text = reader.pages[page_num].extract_text(extraction_mode="plain")
+            page_metadata = {
+                **base_metadata,
+                "page": page_num,
+                "page_label": reader.page_labels[page_num],
+            }
+            pages.append((page_text, page_metadata, page_num, total_pages))
+    return pages, observations
 
         
 if __name__ == "__main__":
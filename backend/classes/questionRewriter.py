@@ -0,0 +1,117 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from langchain_core.output_parsers import StrOutputParser
+
+# Words that usually point back at something said earlier in the conversation
+ANAPHORA_WORDS = {
+    "it", "its", "itself", "they", "them", "their", "theirs", "this", "that", "these", "those",
+    "he", "him", "his", "she", "her", "hers", "there", "former", "latter", "above", "previous",
+    "previously", "earlier", "same", "such", "another", "other", "others", "else", "again",
+    "also", "too", "one", "ones",
+}
+
+# Openers of follow-up questions that only make sense with the history
+FOLLOW_UP_PREFIXES = (
+    "and", "but", "so", "or", "then", "what about", "how about", "why", "how come",
+    "tell me more", "more", "elaborate", "explain", "continue", "go on", "give me", "what else",
+    "example", "examples", "why not", "really", "ok", "okay",
+)
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+def is_self_contained(question: str, min_words=4) -> bool:
+    """Cheap check that a question can be understood without the chat history"""
+    text = question.strip().lower()
+    words = WORD_PATTERN.findall(text)
+    if len(words) < min_words:
+        return False
+    if any(word in ANAPHORA_WORDS for word in words):
+        return False
+    if any(text == prefix or text.startswith(prefix + " ") for prefix in FOLLOW_UP_PREFIXES):
+        return False
+    return True
+
+
+class QuestionRewriter:
+    """Turns follow-up questions into standalone ones, calling the LLM only when it is needed"""
+
+    def __init__(self, llm, prompt, cache_size=1024, history_tail=4):
+        self.rewrite_chain = prompt | llm | StrOutputParser()
+        self.cache_size = cache_size
+        self.history_tail = history_tail
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {
+            "questions": 0,
+            "skipped_no_history": 0,
+            "skipped_self_contained": 0,
+            "cache_hits": 0,
+            "llm_rewrites": 0,
+            "llm_unchanged": 0,
+        }
+
+    def _cache_key(self, question, chat_history):
+        tail = chat_history[-self.history_tail:]
+        payload = "\x00".join([msg.content for msg in tail] + [question.strip()])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _fast_path(self, question, chat_history):
+        """Return the standalone question without an LLM call if possible, else (None, cache_key)"""
+        with self._lock:
+            self.counters["questions"] += 1
+            if not chat_history:
+                self.counters["skipped_no_history"] += 1
+                return question, None
+            if is_self_contained(question):
+                self.counters["skipped_self_contained"] += 1
+                return question, None
+
+            key = self._cache_key(question, chat_history)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.counters["cache_hits"] += 1
+                return self._cache[key], key
+            return None, key
+
+    def _remember(self, key, question, rewritten):
+        rewritten = rewritten.strip() or question
+        with self._lock:
+            self.counters["llm_rewrites"] += 1
+            if rewritten == question.strip():
+                self.counters["llm_unchanged"] += 1
+            self._cache[key] = rewritten
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return rewritten
+
+    def standalone_question(self, inputs: dict) -> str:
+        if inputs.get("standalone_input"):
+            return inputs["standalone_input"]
+        question, chat_history = inputs["input"], inputs.get("chat_history") or []
+        standalone, key = self._fast_path(question, chat_history)
+        if standalone is not None:
+            return standalone
+        rewritten = self.rewrite_chain.invoke({"input": question, "chat_history": chat_history})
+        return self._remember(key, question, rewritten)
+
+    async def astandalone_question(self, inputs: dict) -> str:
+        if inputs.get("standalone_input"):
+            return inputs["standalone_input"]
+        question, chat_history = inputs["input"], inputs.get("chat_history") or []
+        standalone, key = self._fast_path(question, chat_history)
+        if standalone is not None:
+            return standalone
+        rewritten = await self.rewrite_chain.ainvoke({"input": question, "chat_history": chat_history})
+        return self._remember(key, question, rewritten)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        skipped = counters["skipped_no_history"] + counters["skipped_self_contained"] + counters["cache_hits"]
+        counters["skip_rate"] = skipped / counters["questions"] if counters["questions"] else 0.0
+        counters["cached_rewrites"] = len(self._cache)
+        return counters
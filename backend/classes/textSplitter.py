@@ -0,0 +1,182 @@
+import bisect
+import copy
+import hashlib
+from collections import deque
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from classes.metrics import metrics
+
+
+class OffsetTextSplitter:
+    """Produces the same chunks as RecursiveCharacterTextSplitter (keep_separator=True, strip_whitespace=True)
+
+    Works on (start, end) offsets into the original text instead of building substrings at every
+    recursion level, and can return each chunk's offsets.
+    """
+
+    def __init__(self, chunk_size=1000, chunk_overlap=100, separators=None):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) is larger than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators or ["\n\n", "\n", " ", ""]
+
+    def split_spans(self, text: str) -> List[Tuple[int, int]]:
+        """(start, end) offsets of every chunk, so text[start:end] is the chunk"""
+        spans = []
+        self._split(text, 0, len(text), self.separators, spans)
+        return spans
+
+    def split_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def create_documents(self, texts: List[str], metadatas: Optional[List[dict]] = None) -> List[Document]:
+        metadatas = metadatas or [{}] * len(texts)
+        return [
+            Document(page_content=chunk, metadata=copy.deepcopy(metadata))
+            for text, metadata in zip(texts, metadatas)
+            for chunk in self.split_text(text)
+        ]
+
+    def _split(self, text, start, end, separators, spans):
+        # First separator present in this range; finer ones are used to split oversized pieces
+        separator = separators[-1]
+        finer_separators = []
+        for i, candidate in enumerate(separators):
+            if candidate == "":
+                separator = candidate
+                break
+            if text.find(candidate, start, end) != -1:
+                separator = candidate
+                finer_separators = separators[i + 1:]
+                break
+
+        small_pieces = []
+        for piece_start, piece_end in self._pieces(text, start, end, separator):
+            if piece_end - piece_start < self.chunk_size:
+                small_pieces.append((piece_start, piece_end))
+                continue
+            if small_pieces:
+                self._merge(text, small_pieces, spans)
+                small_pieces = []
+            if finer_separators:
+                self._split(text, piece_start, piece_end, finer_separators, spans)
+            else:
+                spans.append((piece_start, piece_end))  # Unsplittable; kept as is, like the original
+        if small_pieces:
+            self._merge(text, small_pieces, spans)
+
+    @staticmethod
+    def _pieces(text, start, end, separator):
+        """Split [start, end) before each separator occurrence (the separator starts the next piece)"""
+        if separator == "":
+            return [(i, i + 1) for i in range(start, end)]
+        pieces = []
+        position = text.find(separator, start, end)
+        if position == -1:
+            return [(start, end)] if end > start else []
+        if position > start:
+            pieces.append((start, position))
+        while position != -1:
+            following = text.find(separator, position + len(separator), end)
+            pieces.append((position, following if following != -1 else end))
+            position = following
+        return pieces
+
+    def _merge(self, text, pieces, spans):
+        """Greedily pack consecutive pieces into chunks, carrying up to chunk_overlap characters over"""
+        current = deque()
+        total = 0
+        for piece_start, piece_end in pieces:
+            length = piece_end - piece_start
+            if total + length > self.chunk_size and current:
+                self._add_stripped(text, current[0][0], current[-1][1], spans)
+                while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                    dropped_start, dropped_end = current.popleft()
+                    total -= dropped_end - dropped_start
+            current.append((piece_start, piece_end))
+            total += length
+        if current:
+            self._add_stripped(text, current[0][0], current[-1][1], spans)
+
+    @staticmethod
+    def _add_stripped(text, start, end, spans):
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if end > start:
+            spans.append((start, end))
+
+
+class DocumentChunker:
+    """Chunks a stream of pages as one continuous text, so paragraphs can run across page breaks
+
+    Pages are joined with a single space and are expected to be whitespace-collapsed, as
+    PDFProcessor._clean_text leaves them. Each chunk records its character offsets in that document
+    text and the pages it spans; only a carry-over window of text is held, never the whole document.
+    "page_hashes" ("page:hash page:hash") fingerprints the text of those pages, so a revised document
+    can be compared page by page without storing the page text.
+    """
+
+    def __init__(self, splitter: OffsetTextSplitter, window_chars=None):
+        self.splitter = splitter
+        # Text is split once this much has accumulated; everything but the last chunk is then final
+        self.window_chars = window_chars or splitter.chunk_size * 8
+
+    def chunk_pages(self, pages: Iterable[Tuple[str, dict]]) -> Iterator[Document]:
+        """pages yields (text, metadata) in order, metadata["page"] being the 1-based page number"""
+        buffer = ""
+        base = 0  # Document offset of buffer[0]
+        page_starts, page_metadata, page_hashes = [], [], []
+        for text, metadata in pages:
+            if buffer:
+                buffer += " "
+            page_starts.append(base + len(buffer))
+            page_metadata.append(metadata)
+            page_hashes.append(f"{metadata['page']}:{hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()}")
+            buffer += text
+            if len(buffer) < self.window_chars:
+                continue
+
+            with metrics.span("split"):
+                spans = self.splitter.split_spans(buffer)
+            # Restart at the space that opens the last chunk's first word (or the oversized word it
+            # was cut from); chunks before it are final and the rest come out the same once re-split
+            restart = buffer.rfind(" ", 0, spans[-1][0]) if spans else len(buffer)
+            if restart <= 0:
+                continue
+            for start, end in spans:
+                if start >= restart:
+                    break
+                yield self._document(buffer, base, start, end, page_starts, page_metadata, page_hashes)
+            buffer = buffer[restart:]
+            base += restart
+            # Pages wholly before the buffer can no longer be cited
+            while len(page_starts) > 1 and page_starts[1] <= base:
+                page_starts.pop(0)
+                page_metadata.pop(0)
+                page_hashes.pop(0)
+
+        with metrics.span("split"):
+            spans = self.splitter.split_spans(buffer)
+        for start, end in spans:
+            yield self._document(buffer, base, start, end, page_starts, page_metadata, page_hashes)
+
+    @staticmethod
+    def _document(buffer, base, start, end, page_starts, page_metadata, page_hashes) -> Document:
+        first = bisect.bisect_right(page_starts, base + start) - 1
+        last = bisect.bisect_right(page_starts, base + end - 1) - 1
+        return Document(page_content=buffer[start:end], metadata={
+            **page_metadata[first],
+            "page_end": page_metadata[last]["page"],
+            "start_offset": base + start,
+            "end_offset": base + end,
+            # Where the chunk begins within its first page's text
+            "page_offset": base + start - page_starts[first],
+            # char_count stays the length of the first page, as it was before chunks spanned pages
+            "chunk_chars": end - start,
+            "page_hashes": " ".join(page_hashes[first:last + 1]),
+        })
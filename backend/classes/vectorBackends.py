@@ -0,0 +1,362 @@
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import List
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from classes.indexStore import IdLocks, IndexStore
+from classes.metrics import metrics
+
+# Chroma data lives next to the FAISS indexes by default
+current_dir = Path(__file__).parent
+project_root = current_dir.parent.parent
+default_chroma_dir = project_root / '.cache' / 'chroma'
+
+# Chroma metadata values must be scalars, so each tag becomes a boolean "tag:<name>" key
+TAG_PREFIX = "tag:"
+
+
+class FaissBackend:
+    """In-memory FAISS stores, persisted as index files by IndexStore"""
+
+    name = "faiss"
+    insert_batch_size = 64  # Small batches make the first part of a document searchable sooner
+
+    def __init__(self, index_store=None):
+        self.index_store = index_store or IndexStore()
+
+    def create(self, index_id, documents, embeddings, rebuild=False):
+        """New in-memory store; nothing is written (or replaced) under index_id until save()"""
+        from classes.faissStore import LockedFAISS
+        vector_store = LockedFAISS.from_documents(documents=documents, embedding=embeddings)
+        vector_store.rebuild_lexical_index()
+        return vector_store
+
+    def exists(self, index_id) -> bool:
+        return self.index_store.exists(index_id)
+
+    def load(self, index_id, embeddings):
+        return self.index_store.load(index_id, embeddings)
+
+    def save(self, index_id, vector_store):
+        self.index_store.save(index_id, vector_store)
+
+    def discard(self, vector_store):
+        """Nothing to clean up: an unsaved FAISS store only exists in memory"""
+
+    def copy(self, index_id, new_index_id, embeddings):
+        """Independent, writable copy of a stored index; it is written under new_index_id by save()"""
+        return IndexStore.ensure_writable(self.index_store.load(index_id, embeddings, mmap=False))
+
+    def delete(self, index_id):
+        self.index_store.delete(index_id)
+
+    def list_indexes(self) -> List[str]:
+        return self.index_store.list_documents()
+
+
+class ChromaStore(VectorStore):
+    """Vector store over a persistent Chroma collection: vectors and chunk text stay on disk
+
+    Offers the same document-level methods as LockedFAISS (chunk_ids, documents, doc_ids / tags
+    pre-filtered search), so the pipeline does not care which one it holds. There is no BM25 leg;
+    retrieval over a Chroma store is vector-only.
+    """
+
+    def __init__(self, collection, embeddings, max_batch_size=5000):
+        self.collection = collection
+        self._embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self._lock = threading.RLock()
+        self._catalog = None  # doc_id -> [chunk count, tags], loaded on first use
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, index_id=None, backend=None, **kwargs):
+        """New collection holding texts, created through ChromaBackend (CHROMA_DIR by default)
+
+        The collection is named index_id, or a generated id (see store.collection.name); like any
+        new collection it is only listed as stored once the backend saves it.
+        """
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [None for _ in texts]
+        documents = [Document(id=chunk_id, page_content=text, metadata=metadata)
+                     for text, metadata, chunk_id in zip(texts, metadatas, ids)]
+        return (backend or ChromaBackend()).create(index_id or uuid.uuid4().hex, documents, embedding)
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        return self.add_embeddings(zip(texts, self._embeddings.embed_documents(texts)), metadatas=metadatas, ids=ids)
+
+    @metrics.span("index_add")
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs):
+        text_embeddings = list(text_embeddings)
+        metadatas = list(metadatas) if metadatas else [{} for _ in text_embeddings]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in text_embeddings]
+        with self._lock:
+            for start in range(0, len(ids), self.max_batch_size):
+                end = start + self.max_batch_size
+                self.collection.add(
+                    ids=ids[start:end],
+                    embeddings=[list(map(float, vector)) for _, vector in text_embeddings[start:end]],
+                    documents=[text for text, _ in text_embeddings[start:end]],
+                    metadatas=[_to_chroma(metadata) for metadata in metadatas[start:end]],
+                )
+            if self._catalog is not None:
+                for metadata in metadatas:
+                    entry = self._catalog.setdefault(metadata.get("doc_id"), [0, set()])
+                    entry[0] += 1
+                    entry[1].update(metadata.get("tags") or ())
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        with self._lock:
+            if ids:
+                self.collection.delete(ids=list(ids))
+            self._catalog = None
+        return True
+
+    def similarity_search(self, query, k=4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self._embeddings.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, doc_ids=None, tags=None, **kwargs):
+        """doc_ids / tags become a Chroma where clause, applied before the nearest-neighbour search"""
+        if (doc_ids is not None and not doc_ids) or (tags is not None and not tags):
+            return []
+        clauses = []
+        if doc_ids is not None:
+            clauses.append({"doc_id": {"$in": list(doc_ids)}})
+        if tags is not None:
+            tag_clauses = [{TAG_PREFIX + tag: True} for tag in tags]
+            clauses.append(tag_clauses[0] if len(tag_clauses) == 1 else {"$or": tag_clauses})
+        where = None if not clauses else clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+        result = self.collection.query(
+            query_embeddings=[list(map(float, embedding))], n_results=k, where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        return [
+            (Document(id=chunk_id, page_content=text, metadata=_from_chroma(metadata)), distance)
+            for chunk_id, text, metadata, distance in zip(
+                result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]
+            )
+        ]
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def chunk_ids(self, doc_id):
+        return self.collection.get(where={"doc_id": doc_id}, include=[])["ids"]
+
+    def documents(self) -> dict:
+        return {doc_id: count for doc_id, (count, _) in self._load_catalog().items()}
+
+    def document_tags(self, doc_id):
+        return sorted(self._load_catalog().get(doc_id, (0, ()))[1])
+
+    def tags(self) -> set:
+        return set().union(*(tags for _, tags in self._load_catalog().values()))
+
+    def get_documents(self, ids):
+        if not ids:
+            return []
+        result = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        by_id = {
+            chunk_id: Document(id=chunk_id, page_content=text, metadata=_from_chroma(metadata))
+            for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+        }
+        return [by_id[chunk_id] for chunk_id in ids]
+
+    def update_metadata(self, ids, metadatas):
+        with self._lock:
+            for start in range(0, len(ids), self.max_batch_size):
+                end = start + self.max_batch_size
+                self.collection.update(ids=list(ids[start:end]),
+                                       metadatas=[_to_chroma(metadata) for metadata in metadatas[start:end]])
+            self._catalog = None
+
+    def _load_catalog(self):
+        """Per-document chunk counts and tags, read once from the collection and then kept up to date"""
+        with self._lock:
+            if self._catalog is None:
+                catalog = {}
+                offset = 0
+                while True:
+                    page = self.collection.get(include=["metadatas"], limit=self.max_batch_size, offset=offset)
+                    for metadata in page["metadatas"]:
+                        metadata = _from_chroma(metadata)
+                        entry = catalog.setdefault(metadata.get("doc_id"), [0, set()])
+                        entry[0] += 1
+                        entry[1].update(metadata.get("tags") or ())
+                    if len(page["ids"]) < self.max_batch_size:
+                        break
+                    offset += self.max_batch_size
+                self._catalog = catalog
+            return self._catalog
+
+
+def _to_chroma(metadata):
+    converted = {}
+    for key, value in metadata.items():
+        if key == "tags":
+            converted.update({TAG_PREFIX + tag: True for tag in value or ()})
+        elif isinstance(value, (str, int, float, bool)):
+            converted[key] = value
+        elif value is not None:
+            converted[key] = str(value)
+    return converted
+
+
+def _from_chroma(metadata):
+    metadata = dict(metadata or {})
+    tags = sorted(key[len(TAG_PREFIX):] for key in metadata if key.startswith(TAG_PREFIX))
+    metadata = {key: value for key, value in metadata.items() if not key.startswith(TAG_PREFIX)}
+    if tags:
+        metadata["tags"] = tags
+    return metadata
+
+
+class ChromaBackend:
+    """Persistent local Chroma: one collection per index, written to disk as chunks are added
+
+    A collection only counts as stored once save() marks it complete, so an interrupted
+    ingestion is rebuilt rather than served half-indexed.
+    """
+
+    name = "chroma"
+    insert_batch_size = 512  # Each add is a disk transaction, so larger batches than FAISS
+
+    def __init__(self, persist_dir=None):
+        self.persist_dir = Path(persist_dir or os.getenv("CHROMA_DIR", default_chroma_dir))
+        self._client = None
+        self._lock = threading.Lock()
+        self.locks = IdLocks()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                # chromadb is only needed when this backend is selected
+                import chromadb
+                from chromadb.config import Settings
+
+                self.persist_dir.mkdir(parents=True, exist_ok=True)
+                self._client = chromadb.PersistentClient(path=str(self.persist_dir),
+                                                         settings=Settings(anonymized_telemetry=False))
+            return self._client
+
+    def _store(self, collection, embeddings):
+        return ChromaStore(collection, embeddings, max_batch_size=self.client.get_max_batch_size())
+
+    def create(self, index_id, documents, embeddings, rebuild=False):
+        """New collection for index_id; an existing one is only replaced when rebuild is True
+
+        A rebuild is written to a collection of its own that save() swaps in, like FAISS's write
+        and rename, so the stored index stays searchable and concurrent rebuilds don't collide.
+        """
+        if not index_id:
+            # Collections are written as they are built, so an unnamed one could never be found again
+            raise ValueError("Chroma collections need an index_id")
+        with self.locks(index_id):
+            if rebuild:
+                name = f"{index_id}.rebuild-{uuid.uuid4().hex[:12]}"
+            elif index_id in {collection.name for collection in self.client.list_collections()}:
+                raise ValueError(f"Collection {index_id} already exists; pass rebuild=True to replace it")
+            else:
+                name = index_id
+            collection = self.client.create_collection(name, metadata={"complete": False})
+        vector_store = self._store(collection, embeddings)
+        vector_store.add_documents(documents)
+        return vector_store
+
+    def _metadata(self, index_id):
+        try:
+            return self.client.get_collection(index_id).metadata or {}
+        except Exception:
+            return {}
+
+    def exists(self, index_id) -> bool:
+        return bool(self._metadata(index_id).get("complete"))
+
+    @metrics.span("index_load")
+    def load(self, index_id, embeddings):
+        return self._store(self.client.get_collection(index_id), embeddings)
+
+    @metrics.span("index_save")
+    def save(self, index_id, vector_store):
+        """Chunks are already on disk; this marks the collection complete, swapping a rebuild in"""
+        metadata = {"complete": True, "saved_at": time.time()}
+        with self.locks(index_id):
+            if vector_store.collection.name == index_id:
+                vector_store.collection.modify(metadata=metadata)
+            else:
+                self._delete(index_id)
+                vector_store.collection.modify(name=index_id, metadata=metadata)
+
+    def discard(self, vector_store):
+        """Drop the collection of a build that failed before save()"""
+        name = vector_store.collection.name
+        with self.locks(name):
+            if not self._metadata(name).get("complete"):
+                self._delete(name)
+
+    def copy(self, index_id, new_index_id, embeddings):
+        """Copy a collection's chunks, vectors included, into a new incomplete collection"""
+        source = self.client.get_collection(index_id)
+        with self.locks(new_index_id):
+            collection = self.client.create_collection(new_index_id, metadata={"complete": False})
+        vector_store = self._store(collection, embeddings)
+        offset = 0
+        while True:
+            page = source.get(include=["embeddings", "documents", "metadatas"],
+                              limit=vector_store.max_batch_size, offset=offset)
+            if len(page["ids"]):
+                vector_store.collection.add(ids=page["ids"], embeddings=page["embeddings"],
+                                            documents=page["documents"], metadatas=page["metadatas"])
+            if len(page["ids"]) < vector_store.max_batch_size:
+                return vector_store
+            offset += vector_store.max_batch_size
+
+    def delete(self, index_id):
+        with self.locks(index_id):
+            self._delete(index_id)
+
+    def _delete(self, index_id):
+        try:
+            self.client.delete_collection(index_id)
+        except Exception:
+            pass
+
+    def list_indexes(self) -> List[str]:
+        """Completed collections, most recently saved first"""
+        collections = [collection for collection in self.client.list_collections()
+                       if (collection.metadata or {}).get("complete")]
+        collections.sort(key=lambda collection: collection.metadata.get("saved_at", 0), reverse=True)
+        return [collection.name for collection in collections]
+
+
+VECTOR_BACKENDS = {"faiss": FaissBackend, "chroma": ChromaBackend}
+
+
+def create_vector_backend(name=None, index_store=None):
+    """Backend selected by VECTOR_BACKEND (faiss or chroma)"""
+    name = name or os.getenv("VECTOR_BACKEND", "faiss")
+    if name not in VECTOR_BACKENDS:
+        raise ValueError(f"Unknown vector backend: {name} (expected one of {sorted(VECTOR_BACKENDS)})")
+    if name == "faiss":
+        return FaissBackend(index_store)
+    return ChromaBackend()
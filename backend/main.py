@@ -1,12 +1,23 @@
-from fastapi import FastAPI, UploadFile, HTTPException
+import time
+startup_started = time.perf_counter()
+
+import classes.env  # Loads .env before any module reads its settings
+from fastapi import FastAPI, Form, Request, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from classes.RAG_Pipeline import RAG_pipeline 
-from classes.chat import ChatRAG
+from classes.documentRegistry import DocumentRegistry
+from classes.ingestionJobs import JobManager
+from classes.conversationStore import ConversationStore
+from classes.metrics import metrics, peak_rss_bytes, server_timing_header
 from langchain_core.messages import HumanMessage, AIMessage
+import asyncio
+import json
 import tempfile
 import shutil
+import threading
 import os
 
 app = FastAPI() 
@@ -20,37 +31,185 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request stage timings in a Server-Timing header (visible in browser dev tools)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    with metrics.request_timings() as timings:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    metrics.observe_request(request.method, route.path if route else "unmatched", response.status_code, elapsed)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing_header({**timings, "total": elapsed})
+    return response
+
+# Models are loaded lazily; warm_up_models() loads them in the background once the server is up
+job_manager = JobManager()
 rag_pipeline = RAG_pipeline() 
-chat_rag = ChatRAG()  # Initialize ChatRAG instance
+document_registry = DocumentRegistry()  # One chain per document, LRU-evicted when idle
+conversation_store = ConversationStore()  # Server-side history for clients that pass a conversation_id
+corpus_lock = threading.Lock()  # Corpus uploads are applied one at a time
+default_lookup_lock = threading.Lock()
+default_looked_up = False
+
+
+def default_doc_id():
+    """The document used by requests without a doc_id: the last processed one, which survives restarts
+
+    Stored indexes are only listed on first use (or by the warm-up thread), since opening the vector
+    store can be slow; a document uploaded before that stays the default.
+    """
+    global default_looked_up
+    with default_lookup_lock:
+        if not default_looked_up:
+            if document_registry.default_doc_id is None:
+                stored_documents = [doc_id for doc_id in rag_pipeline.vector_backend.list_indexes()
+                                    if doc_id != rag_pipeline.corpus_id]
+                if stored_documents:
+                    document_registry.default_doc_id = stored_documents[0]
+            default_looked_up = True
+    return document_registry.default_doc_id
+
+
+startup_report = {
+    "status": "warming_up",
+    "import_seconds": round(time.perf_counter() - startup_started, 3),
+}
+
+
+def warm_up_models():
+    """Load everything the first request would otherwise wait for, recording how long each step took"""
+    try:
+        default_doc_id()
+        start = time.perf_counter()
+        # Start the PDF parsing processes before the embedding model is loaded so they stay small
+        job_manager.warm_up()
+        warm_up = {"parse_processes": round(time.perf_counter() - start, 3)}
+        warm_up.update(rag_pipeline.warm_up())
+        startup_report.update(status="ready", warm_up=warm_up)
+    except Exception as e:
+        startup_report.update(status="error", error=str(e))
+    startup_report["ready_seconds"] = round(time.perf_counter() - startup_started, 3)
+    print(f"Startup: {startup_report}")
+
+
+threading.Thread(target=warm_up_models, name="warm-up", daemon=True).start()
+
 
 class ChatRequest(BaseModel):
     question: str
     history: List[str] = []
+    doc_id: Optional[str] = None
+    conversation_id: Optional[str] = None
+    # Restrict retrieval to these documents / documents with any of these tags (the corpus by default)
+    doc_ids: Optional[List[str]] = None
+    tags: Optional[List[str]] = None
+
+
+class ConversationRequest(BaseModel):
+    doc_id: Optional[str] = None
+
+
+def get_document_session(doc_id: Optional[str]):
+    """Return the session for doc_id, reloading an evicted document from the index store"""
+    doc_id = doc_id or default_doc_id()
+    if not doc_id:
+        raise HTTPException(status_code=400, detail="RAG system not initialized. Please upload and process a document first.")
+
+    session = document_registry.get(doc_id)
+    if session is None:
+        session = rag_pipeline.load_document(doc_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail=f"Unknown document: {doc_id}")
+        document_registry.put(session)
+    return session
+
+
+def save_upload(file: UploadFile) -> str:
+    """Copy an uploaded file to a temporary path"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=file.filename) as tmp:
+        shutil.copyfileobj(file.file, tmp)
+        return tmp.name
+
+
+def ingest_document(job, file_path):
+    """Background ingestion: parse, embed and register a document, reporting progress on the job"""
+    partial_sessions = []
+
+    def register_session(session):
+        # Called early with a partially embedded session: searchable by its doc_id, but not the default yet
+        partial_sessions.append(session)
+        document_registry.put(session)
+        job.doc_id = session.doc_id
+
+    previous_default = default_doc_id()
+    try:
+        session = rag_pipeline.open_document(
+            file_path,
+            on_progress=job.update,
+            parse_executor=job_manager.process_pool,
+            on_session=register_session,
+        )
+        document_registry.put(session)
+        document_registry.default_doc_id = session.doc_id
+        job.doc_id = session.doc_id
+        job.update(peak_rss_bytes=peak_rss_bytes())
+        return session
+    except Exception:
+        # Never serve answers from an index that was not completed and saved
+        for partial in partial_sessions:
+            document_registry.remove(partial.doc_id, partial)
+            rag_pipeline.answer_cache.invalidate(partial.doc_id)
+            if document_registry.default_doc_id == partial.doc_id:
+                document_registry.default_doc_id = previous_default
+        raise
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+@app.post("/upload/")
+async def upload(file: UploadFile):
+    """Queue a document for ingestion and return a job id to poll at /jobs/{job_id}"""
+    temp_file_path = save_upload(file)
+    job = job_manager.submit(ingest_document, temp_file_path, filename=file.filename)
+    return {"message": "File accepted for processing", "status": "queued", "job_id": job.job_id}
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.to_dict()
+
+
+def history_to_messages(history: List[str]):
+    """Rebuild alternating question/answer strings into chat messages"""
+    chat_history = []
+    for i in range(0, len(history), 2):
+        if i + 1 < len(history):
+            chat_history.append(HumanMessage(content=history[i]))
+            chat_history.append(AIMessage(content=history[i + 1]))
+    return chat_history
 
 
 @app.post("/upload_and_process/")
 async def upload_and_process(file: UploadFile):
     try:
         # Create a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file.filename) as tmp:
-            # Copy uploaded file content to temp file
-            shutil.copyfileobj(file.file, tmp)
-            temp_file_path = tmp.name  # Path to temporary file
+        temp_file_path = save_upload(file)
 
-        # Process the file with RAG pipeline
-        result = rag_pipeline.start_RAG(temp_file_path)
-        
-        # Clean up temp file
-        os.remove(temp_file_path)
-
-        if "RAG is READY" in result:
-            # Initialize ChatRAG with the already created conversational RAG chain from pipeline
-            if rag_pipeline.conversational_rag_chain:
-                chat_rag.initialize_chain(rag_pipeline.conversational_rag_chain)
+        # Ingest in the background and wait without blocking other requests
+        job = job_manager.submit(ingest_document, temp_file_path, filename=file.filename)
+        session = await asyncio.wrap_future(job.future)
             
-            return {"message": "File processed successfully", "status": "success"}
-        else:
-            return {"message": f"Processing failed: {result}", "status": "error"}
+        return {"message": "File processed successfully", "status": "success", "doc_id": session.doc_id, "job_id": job.job_id}
             
     except Exception as e:
         # Clean up temp file if it exists
@@ -60,46 +219,334 @@ async def upload_and_process(file: UploadFile):
 
 
 
+def resolve_chat(request: ChatRequest):
+    """Return (session, conversation, chat_history) for a chat request
+
+    With a conversation_id the history comes from the server-side store (trimmed to the token
+    budget); otherwise it is rebuilt from the strings the client sent.
+    """
+    conversation = None
+    doc_id = request.doc_id
+    if not doc_id and (request.doc_ids or request.tags):
+        doc_id = rag_pipeline.corpus_id
+    if request.conversation_id:
+        conversation = conversation_store.get(request.conversation_id)
+        if conversation is None:
+            raise HTTPException(status_code=404, detail=f"Unknown conversation: {request.conversation_id}")
+        doc_id = doc_id or conversation.doc_id
+        chat_history = conversation_store.window(conversation)
+    else:
+        # Convert string history from request to message format
+        chat_history = history_to_messages(request.history)
+
+    session = get_document_session(doc_id)
+    if conversation is not None and conversation.doc_id is None:
+        conversation.doc_id = session.doc_id
+    return session, conversation, chat_history
+
+
+def retrieval_filter(request: ChatRequest, session):
+    """The document subset a chat request is restricted to, or None to search the whole index"""
+    if not request.doc_ids and not request.tags:
+        return None
+    scope = {}
+    if request.doc_ids:
+        unknown = set(request.doc_ids) - set(session.vector_store.documents())
+        if unknown:
+            raise HTTPException(status_code=404, detail=f"Unknown documents: {sorted(unknown)}")
+        scope["doc_ids"] = sorted(set(request.doc_ids))
+    if request.tags:
+        unknown = set(request.tags) - session.vector_store.tags()
+        if unknown:
+            raise HTTPException(status_code=404, detail=f"Unknown tags: {sorted(unknown)}")
+        scope["tags"] = sorted(set(request.tags))
+    return scope
+
+
 @app.post("/chat/")
 async def chat(request: ChatRequest):
     try:
-        # Check if RAG system is initialized
-        if not chat_rag.conversational_rag_chain:
-            raise HTTPException(status_code=400, detail="RAG system not initialized. Please upload and process a document first.")
-        
-        # Convert string history from request to message format
-        chat_history = []
-        for i in range(0, len(request.history), 2):
-            if i + 1 < len(request.history):
-                chat_history.append(HumanMessage(content=request.history[i]))
-                chat_history.append(AIMessage(content=request.history[i + 1]))
+        # Resolve the document and history this conversation is about (may load an index from disk)
+        session, conversation, chat_history = await asyncio.to_thread(resolve_chat, request)
+        chat_rag = session.chat_rag
+        scope = retrieval_filter(request, session)
         
         print(f"Incoming chat history: {len(chat_history)} messages")
         
         # Get answer using ChatRAG
-        result = chat_rag.get_answer(request.question, chat_history)
-        
-        # Update chat history using ChatRAG (this appends the new Q&A)
-        updated_history = chat_rag.get_updated_history(chat_history, result)
+        result = await chat_rag.aget_answer(request.question, chat_history, retrieval_filter=scope)
         
         # Extract sources using ChatRAG
         sources = chat_rag.extract_sources(result)
+
+        response = {
+            "answer": result['answer'], 
+            "sources": sources, 
+            "citations": chat_rag.extract_citations(result),
+            "doc_id": session.doc_id,
+            "cached": result.get("cached", False)
+        }
+
+        if conversation is not None:
+            # History stays on the server; only the new turn goes back
+            conversation_store.append_turn(conversation, request.question, result['answer'])
+            response["conversation_id"] = conversation.conversation_id
+            return response
+        
+        # Update chat history using ChatRAG (this appends the new Q&A)
+        updated_history = chat_rag.get_updated_history(chat_history, result)
         
         # Convert updated history back to strings for response
         history_strings = chat_rag.convert_history_to_strings(updated_history)
 
         print(f"Updated chat history: {len(updated_history)} messages")
-        print(f"History strings: {history_strings}")
         
-        return {
-            "answer": result['answer'], 
-            "sources": sources, 
-            "updated_history": history_strings
-        }
+        response["updated_history"] = history_strings
+        return response
 
+    except HTTPException:
+        raise
     except Exception as e:
+        if getattr(e, "status_code", None) == 429:
+            # Still rate limited after the client's retries
+            raise HTTPException(status_code=429, detail="LLM rate limit reached, please retry shortly")
         raise HTTPException(status_code=500, detail=f"Error during chat: {str(e)}")
-    
+
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream/")
+async def chat_stream(request: ChatRequest):
+    """Stream sources as soon as retrieval finishes, then answer tokens as the LLM produces them"""
+    session, conversation, chat_history = await asyncio.to_thread(resolve_chat, request)
+    chat_rag = session.chat_rag
+    scope = retrieval_filter(request, session)
+
+    async def events():
+        answer_parts = []
+        sources = []
+        citations = []
+        try:
+            async for event, data in chat_rag.astream_answer(request.question, chat_history, retrieval_filter=scope):
+                if event == "sources":
+                    sources = data
+                elif event == "citations":
+                    citations = data
+                else:
+                    answer_parts.append(data)
+                yield sse_event(event, data)
+
+            answer = "".join(answer_parts)
+            done = {"answer": answer, "sources": sources, "citations": citations, "doc_id": session.doc_id}
+            if conversation is not None:
+                conversation_store.append_turn(conversation, request.question, answer)
+                done["conversation_id"] = conversation.conversation_id
+            else:
+                updated_history = chat_rag.get_updated_history(
+                    chat_history, {"input": request.question, "answer": answer}
+                )
+                done["updated_history"] = chat_rag.convert_history_to_strings(updated_history)
+            yield sse_event("done", done)
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Error during chat: {str(e)}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/conversations/")
+async def create_conversation(request: ConversationRequest):
+    """Start a server-side conversation; pass its conversation_id to /chat/ instead of the history"""
+    conversation = conversation_store.create(doc_id=request.doc_id)
+    return {"conversation_id": conversation.conversation_id, "doc_id": conversation.doc_id}
+
+
+@app.get("/conversations/{conversation_id}")
+async def get_conversation(conversation_id: str):
+    conversation = conversation_store.get(conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail=f"Unknown conversation: {conversation_id}")
+    return {
+        "conversation_id": conversation.conversation_id,
+        "doc_id": conversation.doc_id,
+        "history": [msg.content for msg in conversation.messages],
+    }
+
+
+@app.delete("/conversations/{conversation_id}")
+async def delete_conversation(conversation_id: str):
+    if not conversation_store.delete(conversation_id):
+        raise HTTPException(status_code=404, detail=f"Unknown conversation: {conversation_id}")
+    return {"conversation_id": conversation_id, "deleted": True}
+
+
+def update_document(job, fn, session, *args):
+    """Background index update; the temp upload (last argument) is removed afterwards"""
+    try:
+        return fn(session, *args, on_progress=job.update, parse_executor=job_manager.process_pool,
+                  on_session=document_registry.put)
+    finally:
+        if os.path.exists(args[-1]):
+            os.remove(args[-1])
+
+
+@app.post("/documents/{doc_id}/sources/")
+async def add_source(doc_id: str, file: UploadFile):
+    """Add another PDF to an existing document index; only the new chunks are embedded"""
+    session = await asyncio.to_thread(get_document_session, doc_id)
+    temp_file_path = save_upload(file)
+    job = job_manager.submit(update_document, rag_pipeline.add_to_document, session, temp_file_path,
+                             filename=file.filename)
+    try:
+        result = await asyncio.wrap_future(job.future)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error adding document: {str(e)}")
+    return {"doc_id": doc_id, **result}
+
+
+@app.put("/documents/{doc_id}/sources/{source_id}")
+async def replace_source(doc_id: str, source_id: str, file: UploadFile):
+    """Replace a PDF in a document index with a revised version, re-embedding only changed chunks"""
+    session = await asyncio.to_thread(get_document_session, doc_id)
+    if not rag_pipeline.vector_updater.chunk_ids(session.vector_store, source_id):
+        raise HTTPException(status_code=404, detail=f"Unknown source: {source_id}")
+
+    temp_file_path = save_upload(file)
+    job = job_manager.submit(update_document, rag_pipeline.replace_in_document, session, source_id,
+                             temp_file_path, filename=file.filename)
+    try:
+        result = await asyncio.wrap_future(job.future)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error replacing document: {str(e)}")
+    return {"doc_id": doc_id, **result}
+
+
+@app.delete("/documents/{doc_id}/sources/{source_id}")
+async def delete_source(doc_id: str, source_id: str):
+    """Remove one PDF's chunks from a document index"""
+    session = await asyncio.to_thread(get_document_session, doc_id)
+    result = await asyncio.to_thread(rag_pipeline.remove_from_document, session, source_id,
+                                     on_session=document_registry.put)
+    if not result["removed_chunks"]:
+        raise HTTPException(status_code=404, detail=f"Unknown source: {source_id}")
+    return {"doc_id": doc_id, **result}
+
+
+@app.get("/documents/{doc_id}/sources/")
+async def list_sources(doc_id: str):
+    """Source PDFs in a document index with their chunk counts"""
+    session = await asyncio.to_thread(get_document_session, doc_id)
+    return {"doc_id": doc_id, "sources": rag_pipeline.vector_updater.documents(session.vector_store)}
+
+
+def find_corpus_session():
+    """The corpus session (loading it from disk if evicted), or None before the first corpus upload"""
+    session = document_registry.get(rag_pipeline.corpus_id)
+    if session is None:
+        session = rag_pipeline.load_document(rag_pipeline.corpus_id)
+        if session is not None:
+            document_registry.put(session)
+    return session
+
+
+def ingest_corpus_document(job, file_path, tags):
+    """Background corpus ingestion: add one PDF to the shared index, creating it with the first PDF"""
+    try:
+        with corpus_lock:
+            session = find_corpus_session()
+            if session is None:
+                session, result = rag_pipeline.create_corpus(
+                    file_path, tags, on_progress=job.update, parse_executor=job_manager.process_pool,
+                )
+                document_registry.put(session)
+            else:
+                result = rag_pipeline.add_to_document(
+                    session, file_path, on_progress=job.update, parse_executor=job_manager.process_pool, tags=tags,
+                )
+        job.doc_id = result["source_id"]
+        return result
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def remove_corpus_document(session, doc_id):
+    with corpus_lock:
+        return rag_pipeline.remove_from_document(session, doc_id)
+
+
+@app.post("/corpus/documents/")
+async def add_corpus_document(file: UploadFile, tags: str = Form("")):
+    """Queue a PDF for the shared corpus index; tags is a comma-separated list. Poll /jobs/{job_id}"""
+    tag_list = sorted({tag.strip() for tag in tags.split(",") if tag.strip()})
+    temp_file_path = save_upload(file)
+    job = job_manager.submit(ingest_corpus_document, temp_file_path, tag_list, filename=file.filename)
+    return {"message": "File accepted for processing", "status": "queued", "job_id": job.job_id}
+
+
+@app.get("/corpus/documents/")
+async def list_corpus_documents():
+    """Documents in the corpus index with their chunk counts and tags"""
+    session = await asyncio.to_thread(find_corpus_session)
+    if session is None:
+        return {"corpus_id": rag_pipeline.corpus_id, "documents": []}
+    vector_store = session.vector_store
+    return {
+        "corpus_id": rag_pipeline.corpus_id,
+        "documents": [
+            {"doc_id": doc_id, "chunks": chunks, "tags": vector_store.document_tags(doc_id)}
+            for doc_id, chunks in rag_pipeline.vector_updater.documents(vector_store).items()
+        ],
+    }
+
+
+@app.delete("/corpus/documents/{doc_id}")
+async def delete_corpus_document(doc_id: str):
+    """Remove one PDF from the corpus index"""
+    session = await asyncio.to_thread(find_corpus_session)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown document: {doc_id}")
+    result = await asyncio.to_thread(remove_corpus_document, session, doc_id)
+    if not result["removed_chunks"]:
+        raise HTTPException(status_code=404, detail=f"Unknown document: {doc_id}")
+    return {"corpus_id": rag_pipeline.corpus_id, **result}
+
+
+@app.get("/ready/")
+async def ready():
+    """Readiness probe: 200 once the models are warm, 503 while they are still loading"""
+    status_code = 200 if startup_report["status"] == "ready" else 503
+    return JSONResponse(startup_report, status_code=status_code)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage latency histograms, token and chunk counters and peak RSS in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats/")
+async def stats():
+    """Cache and reformulation counters"""
+    return {
+        "question_rewriter": rag_pipeline.rag_chain.question_rewriter.stats(),
+        "embedding_cache": rag_pipeline.vector_embedder.embedding_cache.stats(),
+        "answer_cache": rag_pipeline.answer_cache.stats(),
+    }
+
+
+@app.get("/documents/")
+async def list_documents():
+    """Loaded document sessions and registry memory usage"""
+    return {
+        "default_doc_id": default_doc_id(),
+        "vector_backend": rag_pipeline.vector_backend.name,
+        "stored_documents": rag_pipeline.vector_backend.list_indexes(),
+        **document_registry.stats(),
+    }
 
 
 if __name__ == "__main__":
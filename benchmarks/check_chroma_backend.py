@@ -0,0 +1,113 @@
+"""Check that the Chroma backend stores, filters, copies and replaces indexes like the FAISS one
+
+    python benchmarks/check_chroma_backend.py [--chunks 300]
+
+Runs against a temporary CHROMA_DIR (chromadb must be installed). A new collection must not be
+listed until it is saved; doc_ids / tags filters must only return matching chunks; a copy must be
+independent of its source; a rebuild must leave the stored index searchable until it is saved and
+leave no other collections behind. Exits with status 1 if any check fails.
+"""
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from classes.vectorBackends import ChromaBackend, ChromaStore
+
+
+def chunks(n_chunks, doc_id, tags):
+    return [Document(page_content=f"chunk {i} of {doc_id}", metadata={"doc_id": doc_id, "tags": tags, "page": i})
+            for i in range(n_chunks)]
+
+
+def collection_names(backend):
+    return sorted(collection.name for collection in backend.client.list_collections())
+
+
+def check(backend, embeddings, n_chunks):
+    """Yields a message for every failed check"""
+    # from_texts goes through the backend, under a generated id
+    store = ChromaStore.from_texts(["alpha", "beta"], embeddings, metadatas=[{"doc_id": "a"}, {"doc_id": "b"}],
+                                   backend=backend)
+    name = store.collection.name
+    if store.count() != 2 or sorted(store.documents()) != ["a", "b"]:
+        yield f"from_texts stored {store.count()} chunks of {sorted(store.documents())}"
+    if backend.exists(name) or name in backend.list_indexes():
+        yield "an unsaved collection is listed as stored"
+    backend.save(name, store)
+    if not backend.exists(name):
+        yield "a saved collection is not listed as stored"
+    backend.delete(name)
+    if backend.exists(name) or name in collection_names(backend):
+        yield "delete left the collection behind"
+
+    try:
+        backend.create(None, chunks(1, "x", []), embeddings)
+        yield "create without an index_id succeeded"
+    except ValueError:
+        pass
+
+    store = backend.create("corpus", chunks(n_chunks, "hr", ["policy"]), embeddings)
+    store.add_documents(chunks(n_chunks, "eng", ["engineering"]))
+    backend.save("corpus", store)
+    try:
+        backend.create("corpus", chunks(1, "x", []), embeddings)
+        yield "create over a stored collection without rebuild succeeded"
+    except ValueError:
+        pass
+
+    store = backend.load("corpus", embeddings)
+    if store.documents() != {"hr": n_chunks, "eng": n_chunks}:
+        yield f"documents() is {store.documents()}"
+    if store.tags() != {"policy", "engineering"} or store.document_tags("eng") != ["engineering"]:
+        yield f"tags() is {store.tags()}"
+    if len(store.chunk_ids("hr")) != n_chunks:
+        yield f"chunk_ids('hr') has {len(store.chunk_ids('hr'))} ids"
+    for kwargs, doc_id in (({"doc_ids": ["hr"]}, "hr"), ({"tags": ["engineering"]}, "eng")):
+        found = {doc.metadata["doc_id"] for doc, _ in store.similarity_search_with_score("chunk 3", k=20, **kwargs)}
+        if found != {doc_id}:
+            yield f"search with {kwargs} returned chunks of {sorted(found)}"
+    if store.similarity_search_with_score("chunk 3", k=4, doc_ids=[]):
+        yield "search with an empty doc_ids returned chunks"
+
+    # A copy is independent of its source
+    copy = backend.copy("corpus", "corpus-copy", embeddings)
+    copy.delete(copy.chunk_ids("hr"))
+    backend.save("corpus-copy", copy)
+    if backend.load("corpus", embeddings).count() != 2 * n_chunks or copy.count() != n_chunks:
+        yield "deleting from a copy changed its source"
+
+    # A rebuild leaves the stored collection in place until it is saved
+    rebuild = backend.create("corpus", chunks(3, "new", []), embeddings, rebuild=True)
+    if backend.load("corpus", embeddings).count() != 2 * n_chunks:
+        yield "a rebuild replaced the stored collection before save()"
+    backend.save("corpus", rebuild)
+    if backend.load("corpus", embeddings).documents() != {"new": 3}:
+        yield "save() did not swap the rebuild in"
+    failed = backend.create("corpus", chunks(3, "failed", []), embeddings, rebuild=True)
+    backend.discard(failed)
+    if collection_names(backend) != ["corpus", "corpus-copy"]:
+        yield f"collections left behind: {collection_names(backend)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=300)
+    args = parser.parse_args()
+
+    embeddings = DeterministicFakeEmbedding(size=64)
+    with tempfile.TemporaryDirectory() as persist_dir:
+        failures = list(check(ChromaBackend(persist_dir), embeddings, args.chunks))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    print(f"chroma backend: {'FAIL' if failures else 'ok'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Check that chunk deduplication drops repeats and near-copies but keeps chunks with other values
+
+    python benchmarks/check_dedup.py [--variants 200]
+
+Chunks that differ from an earlier one in a single number (a date, an amount, a table row) and
+unrelated chunks with the same numbers must be kept; repeats that differ only in case, spacing or
+punctuation must be dropped. Near-copies (the chunk boundary shifted by a word) of chunks of 120+
+words are near-duplicates: at least --min-near-dropped of them must be dropped. Exits with status 1
+if any check fails.
+"""
+import argparse
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+from classes.dedup import ChunkDeduplicator
+
+WORDS = ("revenue", "growth", "quarter", "margin", "report", "customer", "contract", "period", "region",
+         "increase", "decrease", "total", "annual", "segment", "policy", "the", "of", "and", "in", "for")
+
+
+def paragraph(rng, n_words=120):
+    return " ".join(rng.choice(WORDS) if i % 7 else str(rng.randint(1, 9999)) for i in range(n_words))
+
+
+def number_variants(rng, text, count):
+    """text with one number changed, inserted or removed"""
+    words = text.split()
+    numbers = [i for i, word in enumerate(words) if word.isdigit()]
+    for n in range(count):
+        variant = list(words)
+        kind = n % 3
+        if kind == 0:
+            i = rng.choice(numbers)
+            variant[i] = str(int(variant[i]) + rng.randint(1, 50))
+        elif kind == 1:
+            variant.insert(rng.randrange(len(variant)), str(rng.randint(1, 9999)))
+        else:
+            del variant[rng.choice(numbers)]
+        yield " ".join(variant)
+
+
+def same_numbers(rng, text):
+    """Different words around the same numbers"""
+    return " ".join(word if word.isdigit() else rng.choice(WORDS) for word in text.split())
+
+
+def near_copies(text):
+    """text as a neighbouring chunk boundary would cut it: one word more or less at either end
+
+    Only words, never numbers, so the copies keep the original's numbers.
+    """
+    words = text.split()
+    if not words[-1].isdigit():
+        yield " ".join(words[:-1])
+    yield " ".join(words + ["growth"])
+    yield " ".join(["the"] + words)
+
+
+def noise_variants(text):
+    """The same words and numbers with different case, spacing and punctuation"""
+    yield text.upper()
+    yield text.replace(" ", "  \n", 5)
+    yield text.replace(" the ", ", the ", 3) + "."
+    yield text
+
+
+def is_duplicate_of(original, variant):
+    deduplicator = ChunkDeduplicator()
+    deduplicator.is_duplicate(original)
+    return deduplicator.is_duplicate(variant)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--variants", type=int, default=200)
+    parser.add_argument("--min-near-dropped", type=float, default=0.5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    failed = False
+    kept = dropped = 0
+    near = near_dropped = 0
+    for trial in range(args.variants // 20 or 1):
+        # Short chunks too: one token there moves a larger share of the shingles
+        n_words = (40, 120, 250)[trial % 3]
+        original = paragraph(rng, n_words=n_words)
+        for variant in [*number_variants(rng, original, 20), same_numbers(rng, original)]:
+            if is_duplicate_of(original, variant):
+                print(f"FAIL: dropped a chunk with other words or numbers:\n{original}\n{variant}")
+                failed = True
+            kept += 1
+        for variant in noise_variants(original):
+            if not is_duplicate_of(original, variant):
+                print(f"FAIL: kept a repeat that only differs in case, spacing or punctuation:\n{variant}")
+                failed = True
+            dropped += 1
+        if n_words >= 120:
+            for variant in near_copies(original):
+                near += 1
+                near_dropped += is_duplicate_of(original, variant)
+    if near_dropped < args.min_near_dropped * near:
+        print(f"FAIL: only {near_dropped} of {near} near-copies dropped")
+        failed = True
+    print(f"{kept} chunks with other words or numbers kept, {dropped} repeats and "
+          f"{near_dropped}/{near} near-copies dropped: {'FAIL' if failed else 'ok'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Check that deleting chunks keeps every index type's vectors in line with the docstore
+
+    python benchmarks/check_index_delete.py [--chunks 3000]
+
+For each index type a store is built, one source's chunks (spread across the index) are deleted,
+and every remaining chunk must still map to exactly the vector it had before; filtered and
+unfiltered queries must only return remaining chunks. Exits with status 1 on the first mismatch.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from classes.faissStore import LockedFAISS
+from classes.annIndex import INDEX_TYPES, build_index, index_type_of, reconstruct_all
+
+
+def build_store(embeddings, n_chunks, index_type):
+    texts = [f"chunk {i} of the test corpus" for i in range(n_chunks)]
+    # Every third chunk belongs to "removed", so deleted positions are scattered over the whole index
+    metadatas = [{"doc_id": "removed" if i % 3 == 0 else "kept"} for i in range(n_chunks)]
+    store = LockedFAISS.from_texts(texts, embeddings, metadatas=metadatas)
+    store.index = build_index(reconstruct_all(store.index), index_type)
+    store.rebuild_lexical_index()
+    return store
+
+
+def stored_vectors(store):
+    vectors = reconstruct_all(store.index)
+    return {docstore_id: vectors[position] for position, docstore_id in store.index_to_docstore_id.items()}
+
+
+def check(index_type, embeddings, n_chunks):
+    store = build_store(embeddings, n_chunks, index_type)
+    if index_type_of(store.index) != index_type:
+        return f"built {index_type_of(store.index)} instead of {index_type}"
+    before = stored_vectors(store)
+    store.delete(store.chunk_ids("removed"))
+
+    if store.index.ntotal != len(store.index_to_docstore_id) or store.documents() != {"kept": store.index.ntotal}:
+        return f"{store.index.ntotal} vectors for {len(store.index_to_docstore_id)} docstore entries"
+    after = stored_vectors(store)
+    moved = [docstore_id for docstore_id, vector in after.items() if not np.array_equal(vector, before[docstore_id])]
+    if moved:
+        return f"{len(moved)} of {len(after)} remaining chunks point at another chunk's vector"
+
+    for query in ("chunk 1 of the test corpus", "chunk 2999 of the test corpus"):
+        for doc_ids in (None, ["kept"]):
+            for doc, _ in store.similarity_search_with_score(query, k=4, doc_ids=doc_ids):
+                if doc.metadata["doc_id"] != "kept":
+                    return f"query returned a deleted chunk: {doc.page_content}"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=3000)
+    args = parser.parse_args()
+
+    embeddings = DeterministicFakeEmbedding(size=64)
+    failed = False
+    for index_type in INDEX_TYPES:
+        error = check(index_type, embeddings, args.chunks)
+        print(f"{index_type:<10} {'FAIL: ' + error if error else 'ok'}")
+        failed = failed or error is not None
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Check that OffsetTextSplitter produces exactly the chunks of RecursiveCharacterTextSplitter, and time both
+
+    python benchmarks/check_splitter_compat.py [--cases 2000]
+
+Also checks PDFProcessor._clean_text: it must collapse whitespace exactly like the baseline (split/join)
+and re-join hyphenated line breaks without eating the hyphens of compounds; both versions are timed.
+Exits with status 1 on the first mismatch, printing the failing input.
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from classes.proccessing import PDFProcessor
+from classes.textSplitter import OffsetTextSplitter
+from synthetic_pdf import VOCABULARY, page_lines
+
+SEPARATORS = ["\n\n", "\n", " ", ""]
+PIECES = VOCABULARY + ["\n", "\n\n", "\n\n\n", "  ", " \n ", "\t", "x" * 40, "y" * 400, "-", "ﬁ"]
+
+
+def random_text(rng):
+    return " ".join(rng.choice(PIECES) for _ in range(rng.randint(0, 600)))
+
+
+# Raw text -> what _clean_text must make of it
+CLEAN_CASES = [
+    ("infor-\nmation retrieval", "information retrieval"),
+    ("state-of-the-\nart models", "state-of-the-art models"),
+    ("co\u00ad\noperate", "cooperate"),
+    ("X-\nRay", "X- Ray"),
+    ("part-\n1234", "part- 1234"),
+    ("\ufb01le \ufb02ow e\ufb03cient", "file flow efficient"),
+    ("  a\t\tb\r\n\n c\u00a0d\u3000 ", "a b c d"),
+]
+
+
+def original_clean(text):
+    """PDFProcessor._clean_text before hyphen and ligature handling were added, for timing"""
+    text = " ".join(text.split())
+    text = text.replace("ﬁ", "fi")
+    text = text.replace("ﬂ", "fl")
+    return text
+
+
+def check(texts, chunk_size, chunk_overlap):
+    reference = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                               separators=SEPARATORS)
+    candidate = OffsetTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, separators=SEPARATORS)
+    for text in texts:
+        expected, actual = reference.split_text(text), candidate.split_text(text)
+        if expected != actual:
+            print(f"Mismatch (chunk_size={chunk_size}, chunk_overlap={chunk_overlap}) for input:\n{text!r}")
+            print(f"expected {len(expected)} chunks, got {len(actual)}")
+            sys.exit(1)
+        spans = candidate.split_spans(text)
+        if [text[start:end] for start, end in spans] != actual:
+            print(f"Offsets do not match chunk text for input:\n{text!r}")
+            sys.exit(1)
+
+
+def check_clean(processor, texts):
+    for raw, expected in CLEAN_CASES:
+        if processor._clean_text(raw) != expected:
+            print(f"_clean_text({raw!r}) = {processor._clean_text(raw)!r}, expected {expected!r}")
+            sys.exit(1)
+    # Without line-end hyphens the only ligatures in these texts are the two the baseline handled
+    for text in texts:
+        if "-\n" not in text and processor._clean_text(text) != original_clean(text):
+            print(f"_clean_text differs from the baseline for input:\n{text!r}")
+            sys.exit(1)
+
+
+def timed(fn, texts, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    random_texts = [random_text(rng) for _ in range(args.cases)]
+    # Raw pages (with newlines) and the cleaned single-line text the pipeline actually splits
+    raw_pages = ["\n".join(page_lines(rng, i, 200)) for i in range(200)]
+    processor = PDFProcessor()
+    clean_pages = [processor._clean_text(page) for page in raw_pages]
+    check_clean(processor, random_texts + raw_pages)
+
+    for chunk_size, chunk_overlap in [(1000, 100), (200, 50), (50, 0), (80, 80), (10, 3), (1, 0)]:
+        check(random_texts, chunk_size, chunk_overlap)
+        check(raw_pages + clean_pages, chunk_size, chunk_overlap)
+    print(f"OK: {len(random_texts) + len(raw_pages) * 2} texts x 6 settings produce identical chunks; "
+          f"cleaning matches the baseline")
+
+    reference = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100, separators=SEPARATORS)
+    candidate = OffsetTextSplitter(chunk_size=1000, chunk_overlap=100, separators=SEPARATORS)
+    print(f"split 200 cleaned pages: RecursiveCharacterTextSplitter {timed(reference.split_text, clean_pages) * 1000:.1f} ms, "
+          f"OffsetTextSplitter {timed(candidate.split_text, clean_pages) * 1000:.1f} ms")
+    # Curly quotes and ligatures make pages non-ASCII, which is the slower path for string methods
+    unicode_pages = [page.replace(" the ", " the \u2019 ", 3).replace("fi", "\ufb01", 2) for page in raw_pages]
+    hyphenated_pages = [page.replace("tion ", "tion-\n", 3) for page in raw_pages]
+    for label, pages in (("ASCII", raw_pages), ("non-ASCII", unicode_pages), ("hyphenated", hyphenated_pages)):
+        print(f"clean 200 {label} pages: baseline {timed(original_clean, pages) * 1000:.1f} ms, "
+              f"current {timed(processor._clean_text, pages) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
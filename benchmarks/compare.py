@@ -0,0 +1,73 @@
+"""Compare two benchmark result files and flag regressions
+
+    python benchmarks/compare.py benchmarks/results/<base>.json benchmarks/results/<new>.json --threshold 10
+
+Exits with status 1 if any latency grew (or throughput dropped) by more than the threshold percent.
+"""
+import argparse
+import json
+import sys
+
+# Metrics where a larger value is an improvement; every other *_ms value is a latency
+HIGHER_IS_BETTER = ("items_per_s", "requests_per_s")
+COMPARED = ("mean_ms", "p50_ms", "p95_ms") + HIGHER_IS_BETTER
+
+
+def flatten(results, prefix=""):
+    """{"chat": {"p50_ms": 1}} -> {"chat.p50_ms": 1}"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif key in COMPARED:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(base, new, threshold):
+    base_flat, new_flat = flatten(base["results"]), flatten(new["results"])
+    rows, regressions = [], []
+    for name in sorted(base_flat.keys() & new_flat.keys()):
+        old, current = base_flat[name], new_flat[name]
+        if not old:
+            continue
+        change = (current - old) / old * 100
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        # Per-stage means are diagnostic: shown, but never fail the comparison
+        flag = worse > threshold and not name.startswith("stages.")
+        rows.append((name, old, current, change, flag))
+        if flag:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown in percent")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f"base {base['commit'][:12]}{' (dirty)' if base.get('dirty') else ''}"
+          f"  ->  new {new['commit'][:12]}{' (dirty)' if new.get('dirty') else ''}")
+    if base.get("config") != new.get("config"):
+        print("warning: the runs used different benchmark settings")
+
+    rows, regressions = compare(base, new, args.threshold)
+    width = max((len(row[0]) for row in rows), default=10)
+    for name, old, current, change, flag in rows:
+        print(f"{name:<{width}}  {old:>12.2f}  {current:>12.2f}  {change:>+8.1f}%{'  REGRESSION' if flag else ''}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold}%")
+        sys.exit(1)
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""Ingestion and query benchmarks against a local stub LLM; results are written as JSON per commit
+
+    python benchmarks/run_benchmarks.py                      # real embedding model
+    python benchmarks/run_benchmarks.py --fake-embeddings    # no model download, measures the rest
+    python benchmarks/compare.py benchmarks/results/<old>.json benchmarks/results/<new>.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).parent
+PROJECT_ROOT = BENCHMARKS_DIR.parent
+sys.path.insert(0, str(PROJECT_ROOT / "backend"))
+sys.path.insert(0, str(BENCHMARKS_DIR))
+
+import numpy as np
+
+from synthetic_pdf import make_pdf
+
+QUESTIONS = [
+    "What does the encoder layer do?",
+    "How is the retrieval index built?",
+    "What are the latency results for batch queries?",
+    "Which clause covers the specification requirements?",
+    "What is part-1234 used for?",
+    "How is throughput measured in the evaluation?",
+    "What baseline approach is described?",
+    "Explain the memory requirements of the system.",
+]
+
+
+def summarize(samples, items=None):
+    """Latency percentiles in milliseconds (and items/s when items per sample are given)"""
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))] * 1000
+
+    summary = {
+        "n": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 2),
+        "p50_ms": round(percentile(50), 2),
+        "p95_ms": round(percentile(95), 2),
+        "p99_ms": round(percentile(99), 2),
+    }
+    if items is not None:
+        summary["items_per_s"] = round(items * len(samples) / sum(samples), 2)
+    return summary
+
+
+class HashModel:
+    """Stand-in for the SentenceTransformer model: deterministic vectors from a hash of the text"""
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        vectors = np.empty((len(texts), 384), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vectors[i] = np.random.default_rng(seed).standard_normal(384)
+        return vectors
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=PROJECT_ROOT, capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "HEAD") or "unknown", "dirty": bool(git("status", "--porcelain", "--", "backend"))}
+
+
+def bench_process_pdf(pdfs, repeats):
+    from classes.proccessing import PDFProcessor
+
+    processor = PDFProcessor()
+    results = {}
+    for pages, path in pdfs.items():
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            chunks = processor.process_pdf(path)
+            samples.append(time.perf_counter() - start)
+        results[f"{pages}_pages"] = {**summarize(samples, items=pages), "chunks": len(chunks)}
+    return results
+
+
+def bench_embed_chunks(pdf_path, repeats):
+    from classes.proccessing import PDFProcessor
+    from classes.addVector import VectorEmbedder
+
+    chunks = PDFProcessor().process_pdf(pdf_path)
+    embedder = VectorEmbedder()
+    embedder.base_embeddings.warm_up()
+    samples = []
+    for _ in range(repeats):
+        embedder.embedding_cache.clear()  # Measure the model, not the cache
+        start = time.perf_counter()
+        embedder.embed_chunks(chunks)
+        samples.append(time.perf_counter() - start)
+    return {**summarize(samples, items=len(chunks)), "chunks": len(chunks)}
+
+
+def bench_upload(client, pages, repeats, workdir):
+    samples = []
+    doc_id = None
+    for i in range(repeats):
+        # A new seed per upload so the index store never short-circuits ingestion
+        path = make_pdf(str(workdir / f"upload_{i}.pdf"), pages=pages, seed=1000 + i)
+        with open(path, "rb") as f:
+            start = time.perf_counter()
+            response = client.post("/upload_and_process/", files={"file": (Path(path).name, f, "application/pdf")})
+            samples.append(time.perf_counter() - start)
+        body = response.json()
+        if body.get("status") != "success":
+            raise RuntimeError(f"Upload failed: {body}")
+        doc_id = body.get("doc_id") or doc_id
+    return summarize(samples, items=pages), doc_id
+
+
+async def bench_chat(app, doc_id, requests, concurrency):
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one(client, i):
+        # Distinct questions so the semantic answer cache does not serve them
+        question = f"{QUESTIONS[i % len(QUESTIONS)]} (variant {i})"
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/chat/", json={"question": question, "doc_id": doc_id})
+            samples.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(requests)))
+        wall = time.perf_counter() - start
+    return {**summarize(samples), "requests_per_s": round(requests / wall, 2), "concurrency": concurrency}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", default="10,50,200", help="comma-separated synthetic PDF sizes")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--chat-requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency-ms", type=int, default=0, help="simulated LLM latency of the stub")
+    parser.add_argument("--fake-embeddings", action="store_true", help="replace the embedding model with a hash")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<commit>.json)")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag-bench-"))
+    # Cold caches and a local LLM, set before the backend reads its settings
+    os.environ.update({
+        "LLM_PROVIDER": "stub",
+        "LLM_STUB_LATENCY_MS": str(args.llm_latency_ms),
+        "EMBEDDING_CACHE_DIR": str(workdir / "embedding-cache"),
+        "INDEX_STORE_DIR": str(workdir / "indexes"),
+        "ANSWER_CACHE_THRESHOLD": "1.01",  # Cosine never exceeds 1, so every question misses
+    })
+    if args.fake_embeddings:
+        from classes.embeddingEngine import EmbeddingEngine
+        EmbeddingEngine._load_model = lambda self: HashModel()
+
+    page_counts = [int(pages) for pages in args.pages.split(",")]
+    pdfs = {pages: make_pdf(str(workdir / f"synthetic_{pages}.pdf"), pages=pages, seed=pages)
+            for pages in page_counts}
+
+    results = {}
+    print("Benchmarking PDFProcessor.process_pdf...")
+    results["process_pdf"] = bench_process_pdf(pdfs, args.repeats)
+
+    print("Benchmarking VectorEmbedder.embed_chunks...")
+    results["embed_chunks"] = bench_embed_chunks(pdfs[page_counts[-1]], args.repeats)
+
+    from fastapi.testclient import TestClient
+    import main as backend
+
+    client = TestClient(backend.app)
+    print("Benchmarking /upload_and_process/...")
+    results["upload_and_process"], doc_id = bench_upload(client, page_counts[0], args.repeats, workdir)
+
+    print("Benchmarking /chat/...")
+    results["chat"] = asyncio.run(bench_chat(backend.app, doc_id, args.chat_requests, args.concurrency))
+    results["stages"] = stage_summary(backend.metrics)
+
+    report = {
+        **git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "results": results,
+    }
+    output = Path(args.output) if args.output else BENCHMARKS_DIR / "results" / f"{report['commit'][:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+    backend.job_manager.shutdown()
+
+
+def stage_summary(metrics):
+    """Mean milliseconds per pipeline stage, from the backend's own metrics"""
+    summary = {}
+    for line in metrics.render().splitlines():
+        if line.startswith("rag_stage_seconds_sum"):
+            stage = line.split('stage="', 1)[1].split('"', 1)[0]
+            summary.setdefault(stage, {})["total_s"] = float(line.rsplit(" ", 1)[1])
+        elif line.startswith("rag_stage_seconds_count"):
+            stage = line.split('stage="', 1)[1].split('"', 1)[0]
+            summary.setdefault(stage, {})["count"] = int(line.rsplit(" ", 1)[1])
+    return {
+        stage: {"count": values["count"], "mean_ms": round(values["total_s"] / values["count"] * 1000, 3)}
+        for stage, values in sorted(summary.items()) if values.get("count")
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Generate synthetic text PDFs for benchmarks, without any PDF library
+
+    python benchmarks/synthetic_pdf.py out.pdf --pages 50 --seed 1
+"""
+import argparse
+import random
+
+VOCABULARY = (
+    "the model attention layer encoder decoder training data token sequence vector index query "
+    "retrieval document section results table figure method approach system performance memory "
+    "latency throughput batch embedding search accuracy evaluation baseline parameter value "
+    "section-4.2 part-1234 ISO/IEC clause 7.3.1 appendix procedure requirement specification "
+    "and of to in for with on by is are was be as that this which from at an or not"
+).split()
+
+LINES_PER_PAGE = 46
+WORDS_PER_LINE = 13
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def page_lines(rng, page_num, total_pages, header=True):
+    """Text lines of one page: paragraphs of random sentences, plus a running header and footer"""
+    lines = []
+    if header:
+        lines.append("ACME Technical Manual - Revision 3")
+    while len(lines) < LINES_PER_PAGE - 2:
+        # Paragraphs of a few lines, separated by an empty line
+        for _ in range(rng.randint(3, 8)):
+            words = [rng.choice(VOCABULARY) for _ in range(WORDS_PER_LINE)]
+            words[0] = words[0].capitalize()
+            lines.append(" ".join(words) + ("." if rng.random() < 0.4 else ""))
+        lines.append("")
+    lines = lines[:LINES_PER_PAGE - 2]
+    if header:
+        lines.append(f"Page {page_num + 1} of {total_pages}")
+    return lines
+
+
+def make_pdf(path, pages=10, seed=0, header=True):
+    """Write a PDF with `pages` pages of text and return its path"""
+    rng = random.Random(seed)
+    objects = []  # bodies of objects 1..n
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    page_tree = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for page_num in range(pages):
+        ops = ["BT", "/F1 10 Tf", "14 TL", "50 790 Td"]
+        for line in page_lines(rng, page_num, pages, header):
+            ops.append(f"({_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (page_tree, font, content)
+        ))
+
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % page_tree
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[page_tree - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-header", action="store_true", help="omit the running header/footer lines")
+    args = parser.parse_args()
+    make_pdf(args.path, args.pages, args.seed, header=not args.no_header)
+    print(f"Wrote {args.pages} pages to {args.path}")
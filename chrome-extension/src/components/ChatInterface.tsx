@@ -10,6 +10,7 @@ interface ChatInterfaceProps {
   onNewMessage: (message: ChatMessage) => void;
   onHistoryUpdate: (history: string[]) => void;
   isDocumentUploaded: boolean;
+  docId: string | null;
 }
 
 const ChatContainer = styled.div`
@@ -133,7 +134,8 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({
   chatHistory,
   onNewMessage,
   onHistoryUpdate,
-  isDocumentUploaded
+  isDocumentUploaded,
+  docId
 }) => {
   const [inputValue, setInputValue] = useState('');
   const [isLoading, setIsLoading] = useState(false);
@@ -165,7 +167,8 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({
     try {
       const response = await RAGApiService.sendChatMessage({
         question: userMessage.content,
-        history: chatHistory
+        history: chatHistory,
+        ...(docId ? { doc_id: docId } : {})
       });
 
       const assistantMessage: ChatMessage = {
@@ -4,7 +4,7 @@ import styled from 'styled-components';
 import { RAGApiService } from '../services/api';
 
 interface FileUploadProps {
-  onUploadSuccess: () => void;
+  onUploadSuccess: (docId: string | null) => void;
   onUploadStart: () => void;
   onError: (error: string) => void;
   isLoading: boolean;
@@ -151,7 +151,8 @@ export const FileUpload: React.FC<FileUploadProps> = ({
       if (response.status === 'success') {
         setUploadStatus('✅ Document processed successfully!');
         setStatusType('success');
-        onUploadSuccess();
+        // Chats send this doc_id so they never fall back to another user's document
+        onUploadSuccess(response.doc_id || null);
         setSelectedFile(null);
       } else {
         throw new Error(response.message);
@@ -88,6 +88,7 @@ const ClearButton = styled.button`
 export const App: React.FC = () => {
   const [appState, setAppState] = useState<AppState>({
     isDocumentUploaded: false,
+    docId: null,
     chatHistory: [],
     messages: [],
     isLoading: false,
@@ -115,10 +116,11 @@ export const App: React.FC = () => {
     setAppState(prev => ({ ...prev, isLoading: true, error: null }));
   };
 
-  const handleUploadSuccess = () => {
+  const handleUploadSuccess = (docId: string | null) => {
     setAppState(prev => ({
       ...prev,
       isDocumentUploaded: true,
+      docId,
       isLoading: false,
       error: null,
       messages: [],
@@ -221,6 +223,7 @@ export const App: React.FC = () => {
               onNewMessage={handleNewMessage}
               onHistoryUpdate={handleHistoryUpdate}
               isDocumentUploaded={appState.isDocumentUploaded}
+              docId={appState.docId}
             />
           </>
         ) : (
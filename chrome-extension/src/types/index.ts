@@ -8,20 +8,24 @@ export interface ChatResponse {
   answer: string;
   sources: string[];
   updated_history: string[];
+  doc_id?: string;
 }
 
 export interface UploadResponse {
   message: string;
   status: 'success' | 'error';
+  doc_id?: string;
 }
 
 export interface ChatRequest {
   question: string;
   history: string[];
+  doc_id?: string;
 }
 
 export interface AppState {
   isDocumentUploaded: boolean;
+  docId: string | null;
   chatHistory: string[];
   messages: ChatMessage[];
   isLoading: boolean;
@@ -23,6 +23,8 @@ def main():
         st.session_state.messages = []
     if "document_uploaded" not in st.session_state:
         st.session_state.document_uploaded = False
+    if "doc_id" not in st.session_state:
+        st.session_state.doc_id = None
     
     # Sidebar for file upload
     with st.sidebar:
@@ -125,7 +127,10 @@ def upload_and_process_document(uploaded_file):
         
         if response.status_code == 200:
             result = response.json()
-            return result.get("status") == "success"
+            if result.get("status") == "success":
+                st.session_state.doc_id = result.get("doc_id")
+                return True
+            return False
         else:
             st.error(f"Upload failed: {response.text}")
             return False
@@ -139,7 +144,8 @@ def send_chat_message(question):
     try:
         payload = {
             "question": question,
-            "history": st.session_state.chat_history
+            "history": st.session_state.chat_history,
+            "doc_id": st.session_state.doc_id
         }
         
         response = requests.post(